@@ -1,6 +1,6 @@
 from .simulator import Patient
-from .disturbances import compute_disturbances
+from .disturbances import compute_disturbances, compute_disturbances_array
 from .metrics import compute_control_metrics
 from .pk_models import CompartmentModel
-from .pd_models import BIS_model, TOL_model, Hemo_meca_PD_model
+from .pd_models import BIS_model, BIS_population, TOL_model, Hemo_meca_PD_model, Hemo_meca_PD_ensemble
 from .tci_control import TCIController
@@ -1,8 +1,198 @@
 import numpy as np
 
+# Knot tables of the disturbance profiles: time (min), BIS signal, MAP, CO signals.
+# They are built once at import so that compute_disturbances only has to interpolate.
+
+# As proposed in M. M. R. F. Struys, T. De Smet, S. Greenwald, A. R. Absalom, S. Bingé, and E. P. Mortier,
+# “Performance Evaluation of Two Published Closed-loop Control Systems Using Bispectral Index Monitoring:
+#  A Simulation Study,”
+# Anesthesiology, vol. 100, no. 3, pp. 640–647, Mar. 2004, doi: 10.1097/00000542-200403000-00026.
+_REALISTIC_POINTS = np.array([[0,     0,  0, 0],  # time, BIS signal, MAP, CO signals
+                              [9.9,   0,  0, 0],
+                              [10,   20, 10, 0.6],
+                              [12,   20, 10, 0.6],
+                              [13,    0,  0, 0],
+                              [19.9,  0,  0, 0],
+                              [20.2, 20, 10, 0.5],
+                              [21,   20, 10, 0.5],
+                              [21.5,  0,  0, 0],
+                              [26,  -20, -10, -0.8],
+                              [27,   20, 10, 0.9],
+                              [28,   10,  7, 0.2],
+                              [36,   10,  7, 0.2],
+                              [37,   30, 15, 0.8],
+                              [37.5, 30, 15, 0.8],
+                              [38,   10,  5, 0.2],
+                              [41,   10,  5, 0.2],
+                              [41.5, 30, 10, 0.5],
+                              [42,   30, 10, 0.5],
+                              [43,   10,  5, 0.2],
+                              [47,   10,  5, 0.2],
+                              [47.5, 30, 10, 0.9],
+                              [50,   30,  8, 0.9],
+                              [51,   10,  5, 0.2],
+                              [56,   10,  5, 0.2],
+                              [56.5,  0,  0, 0]])
+
+# As proposed in Ionescu, Clara M., et al. "An open source patient simulator for design and evaluation of computer
+# based multiple drug dosing control for anesthetic and hemodynamic variables." IEEE Access 9 (2021): 8680-8694.
+# doi: 10.1109/ACCESS.2021.3049880
+_REALISTIC2_POINTS = np.array([[0,     0,  0, 0],  # time, BIS signal, MAP, CO signals
+                               [9.9,   0,  0, 0],
+                               [10,   20, 10, 0.5],
+                               [15,   20, 10, 0.5],
+                               [15.1,  0,  0, 0],
+                               [19.9,  0,  0, 0],
+                               [20,   20, 10, 0.5],
+                               [25,   20, 10, 0.5],
+                               [25.1,  0,  0, 0],
+                               [26.9,-20,-10, -0.5],
+                               [27,   20, 10, 0.5],
+                               [32,   20, 10, 0.5],
+                               [32.1,  0,  0, 0],
+                               [41.9,  0,  0, 0],
+                               [42,   20, 10, 0.5],
+                               [44,   20, 10, 0.5],
+                               [44.1,  0,  0, 0],
+                               [50,    0,  0, 0],
+                               [50.1, 20, 10, 0.5],
+                               [55,   20, 10, 0.5],
+                               [55.1,  0,  0, 0],
+                               [75,    0,  0, 0],
+                               [75.1, 20, 10, 0.5],
+                               [95,   20, 10, 0.5],
+                               [95.1,  0,  0, 0],
+                               [100,   0,  0, 0]])
+
+# The events in this major surgery are Intubation, Incision, recipient hepatectomy, donor liver implementation,
+_LIVER_TRANSPLANTATION_POINTS = np.array([[0,     0,  0, 0],  # time, BIS signal, MAP, CO signals
+                                          [9.9,   0,  0, 0],    [10,   20, 10, 0.5],    [13,   20, 10, 0.5],    [13.1,  0,  0, 0],
+                                          [16,    0,  0, 0],    [16.1, 15,  8, 0.4],    [21,   15,  8, 0.4],    [21.1, 20, 10, 0.5],
+                                          [27,   20, 10, 0.5],  [27.1,  0,  0,   0],    [29,    0,  0,   0],    [29.1,  5,  2, 0.1],
+                                          [37,    5,  2, 0.1],  [37.1,  0,  0,   0],    [39,    0,  0,   0],    [39.1,  5,  2, 0.1],
+                                          [46,    5,  2, 0.1],  [46.1,  0,  0,   0],    [51,    0,  0,   0],    [51.1, 10,  5, 0.2],
+                                          [56,   10,  5, 0.2],  [56.1,  0,  0,   0],    [65,    0,  0,   0],    [65.1, 10,  5, 0.2],
+                                          [69,   10,  5, 0.2],  [69.1,  0,  0,   0],    [78,    0,  0,   0],    [78.1, 10,  5, 0.2],
+                                          [82,   10,  5, 0.2],  [82.1,  0,  0,   0],    [88,    0,  0,   0],    [90,    5,  2, 0.1],
+                                          [114,   5,  2, 0.1],  [114.1, 0,  0,   0],    [116,   0,  0,   0],    [121.5, 0,  0,   0],
+                                          [123.5, 5,  2, 0.1],  [125.5, 0,  0,   0],    [130.5, 0,  0,   0],    [132.5, 5,  2, 0.1],
+                                          [134.5, 0,  0, 0],    [141,   0,  0,   0],    [141.1,10,  5, 0.2],    [145,  10,  5, 0.2],
+                                          [145.1, 0,  0, 0],    [150,   0,  0,   0],    [151,  10,  5, 0.2],    [155,  10,  5, 0.2],
+                                          [156,   5,  2, 0.1],  [157,  10,  5, 0.2],    [161,  10,  5, 0.2],    [162,   0,  0,   0],
+                                          [165,   0,  0, 0],    [166,   5,  2, 0.1],    [169,   5,  2, 0.1],    [169.1,10,  5, 0.2],
+                                          [171,  10,  5, 0.2],  [172,   0,  0,   0],    [173,   0,  0,   0],    [173.5,10,  5, 0.2],
+                                          [174,   0,  0, 0],    [181,   0,  0,   0],    [181.1,15,  8, 0.4],    [183.5,15,  8, 0.4],
+                                          [183.6, 0,  0, 0],    [186,   0,  0,   0],    [186.1,10,  5, 0.2],    [189,  10,  5, 0.2],
+                                          [189.1, 0,  0, 0],    [190,   0,  0,   0],    [190.1, 5,  2, 0.1],    [193,  5,   2, 0.1],
+                                          [193.1, 0,  0, 0],    [196,   0,  0,   0],    [198,   8,  4, 0.1],    [204,  8,   4, 0.1],
+                                          [206,   0,  0, 0],    [208,   0,  0,   0],    [210,  10,  5, 0.2],    [222, 10,   5, 0.2],
+                                          [224,   0,  0, 0],    [226,   5,  2, 0.1],    [227,  12,  6,  0.3],   [232, 12,   6, 0.3],
+                                          [234,   0,  0, 0],    [237,   0,  0,   0],    [238,   8,  4, 0.1],    [251,  8,   4, 0.1],
+                                          [252,   0,  0, 0],    [260,   0,  0,   0],    [263,  15,  8, 0.4],    [270, 15,   8, 0.4],
+                                          [273,   5,  2, 0.1],  [338,   5,  2, 0.1],    [341,  0,  0,    0],    [350,  0,   0,   0]])
+
+# As in G. A. Dumont, A. Martinez, and J. M. Ansermino,
+# “Robust control of depth of anesthesia,”
+# International Journal of Adaptive Control and Signal Processing,
+# vol. 23, no. 5, pp. 435–454, 2009, doi: 10.1002/acs.1087.
+_SIMPLE_POINTS = np.array([[0,     0,  0, 0],  # time, BIS signal, MAP, CO signals
+                           [19.9,  0,  0, 0],
+                           [20,   20,  5, 0.3],
+                           [23,   20, 10, 0.6],
+                           [24,   15, 10, 0.6],
+                           [26, 12.5,  6, 0.4],
+                           [30, 10.5,  4, 0.3],
+                           [37,   10,  4, 0.3],
+                           [40,    4,  2, 0.1],
+                           [45,  0.5, 0.1, 0.01],
+                           [50,    0,  0,   0]])
+
+
+def _split_profile(disturb_point: np.ndarray) -> tuple:
+    """Split a knot table into a contiguous time vector and a contiguous (N, 3) array of BIS, MAP and CO values."""
+    return (np.ascontiguousarray(disturb_point[:, 0], dtype=np.float64),
+            np.ascontiguousarray(disturb_point[:, 1:], dtype=np.float64))
+
+
+def _bracket(t: float, t_point: np.ndarray, guess: int = 0) -> int:
+    """Give the index i of the knot interval [t_point[i], t_point[i+1]] used to interpolate at t.
+
+    The interval guess and the following one are tried first, so that a monotone sweep in time rarely needs a
+    search. The index is clamped to the first and last intervals.
+    """
+    for i in (guess, guess + 1):
+        if i < len(t_point) - 1 and t_point[i] <= t < t_point[i+1]:
+            return i
+    i = int(np.searchsorted(t_point, t, side='right')) - 1
+    return max(0, min(i, len(t_point) - 2))
+
+
+def _interp3(t: float, t_point: np.ndarray, y_point: np.ndarray, out: np.ndarray, i: int) -> np.ndarray:
+    """Linear interpolation of the three disturbance signals on knot interval i, written in out.
+
+    Values outside of the knot interval are clamped to the first and last knots, as with np.interp.
+    """
+    dt = t_point[i+1] - t_point[i]
+    w = max(0.0, min((t - t_point[i]) / dt, 1.0)) if dt > 0 else 1.0
+    np.subtract(y_point[i+1], y_point[i], out=out)
+    out *= w
+    out += y_point[i]
+    return out
+
+
+_PROFILES = {'realistic': _split_profile(_REALISTIC_POINTS),
+             'realistic2': _split_profile(_REALISTIC2_POINTS),
+             'liverTransplantation': _split_profile(_LIVER_TRANSPLANTATION_POINTS),
+             'simple': _split_profile(_SIMPLE_POINTS)}
+
+
+# Step profile: [BIS, MAP, CO] amplitude, reached through linear ramps lasting _STEP_RAMP minutes
+# before start_step and before end_step.
+_STEP_AMPLITUDE = (10, 5, 0.3)
+_STEP_RAMP = 0.01
+
+
+# Last knot interval used by each profile, simulations usually query increasing times.
+_LAST_INDEX = dict.fromkeys(_PROFILES, 0)
+
+
+def _knot_handler(name: str):
+    """Build the handler of a profile defined by a fixed knot table."""
+    t_point, y_point = _PROFILES[name]
+
+    def handler(time: float, start_step: float, end_step: float, out: np.ndarray) -> np.ndarray:
+        t = time/60
+        i = _bracket(t, t_point, _LAST_INDEX[name])
+        _LAST_INDEX[name] = i
+        return _interp3(t, t_point, y_point, out, i)
+    return handler
+
+
+def _step_handler(time: float, start_step: float, end_step: float, out: np.ndarray) -> np.ndarray:
+    """Handler of the step profile, evaluated in closed form."""
+    t = time/60
+    rise = min(max((t - start_step/60)/_STEP_RAMP + 1, 0.0), 1.0)
+    fall = min(max((t - end_step/60)/_STEP_RAMP + 1, 0.0), 1.0)
+    level = rise - fall
+    out[0] = _STEP_AMPLITUDE[0]*level
+    out[1] = _STEP_AMPLITUDE[1]*level
+    out[2] = _STEP_AMPLITUDE[2]*level
+    return out
+
+
+def _null_handler(time: float, start_step: float, end_step: float, out: np.ndarray) -> np.ndarray:
+    """Handler of the null profile."""
+    out[:] = 0
+    return out
+
+
+_DISPATCH = {name: _knot_handler(name) for name in _PROFILES}
+_DISPATCH['step'] = _step_handler
+_DISPATCH['null'] = _null_handler
+
 
 def compute_disturbances(time: float, dist_profil: str = 'realistic',
-                         start_step: float = 600, end_step: float = 1200) -> list:
+                         start_step: float = 600, end_step: float = 1200, out: np.ndarray = None) -> np.ndarray:
     """
     Give the value of the distubance profile for a given time.
 
@@ -11,142 +201,69 @@ def compute_disturbances(time: float, dist_profil: str = 'realistic',
     time : float
         Time: in seconds.
     dist_profil : str, optional
-        disturbance profile, can be: 'realistic', 'realistic2', 'liver_transplantation', 'simple', 'step' or "null". The default is 'realistic'.
+        disturbance profile, can be: 'realistic', 'realistic2', 'liverTransplantation', 'simple', 'step' or "null". The default is 'realistic'.
     start_step : float, optional
         start time of the step distuebance (seconds). The default is 600s.
     end_step : float, optional
         End time of the step distuebance (seconds). The default is 1200s.
+    out : np.ndarray, optional
+        Array of size 3 in which the result is written. The default is None, in which case a new array is returned.
 
     Returns
     -------
-    list
+    np.ndarray
         dist_bis, dist_map, dist_co: respectively the additive disturbance to add to the BIS, MAP and CO signals.
 
     """
-    if dist_profil == 'realistic':
-        # As proposed in M. M. R. F. Struys, T. De Smet, S. Greenwald, A. R. Absalom, S. Bingé, and E. P. Mortier,
-        # “Performance Evaluation of Two Published Closed-loop Control Systems Using Bispectral Index Monitoring:
-        #  A Simulation Study,”
-        # Anesthesiology, vol. 100, no. 3, pp. 640–647, Mar. 2004, doi: 10.1097/00000542-200403000-00026.
-
-        Disturb_point = np.array([[0,     0,  0, 0],  # time, BIS signal, MAP, CO signals
-                                  [9.9,   0,  0, 0],
-                                  [10,   20, 10, 0.6],
-                                  [12,   20, 10, 0.6],
-                                  [13,    0,  0, 0],
-                                  [19.9,  0,  0, 0],
-                                  [20.2, 20, 10, 0.5],
-                                  [21,   20, 10, 0.5],
-                                  [21.5,  0,  0, 0],
-                                  [26,  -20, -10, -0.8],
-                                  [27,   20, 10, 0.9],
-                                  [28,   10,  7, 0.2],
-                                  [36,   10,  7, 0.2],
-                                  [37,   30, 15, 0.8],
-                                  [37.5, 30, 15, 0.8],
-                                  [38,   10,  5, 0.2],
-                                  [41,   10,  5, 0.2],
-                                  [41.5, 30, 10, 0.5],
-                                  [42,   30, 10, 0.5],
-                                  [43,   10,  5, 0.2],
-                                  [47,   10,  5, 0.2],
-                                  [47.5, 30, 10, 0.9],
-                                  [50,   30,  8, 0.9],
-                                  [51,   10,  5, 0.2],
-                                  [56,   10,  5, 0.2],
-                                  [56.5,  0,  0, 0]])
-        
-    elif dist_profil == 'realistic2':
-         # As proposed in Ionescu, Clara M., et al. "An open source patient simulator for design and evaluation of computer 
-         # based multiple drug dosing control for anesthetic and hemodynamic variables." IEEE Access 9 (2021): 8680-8694.
-         # doi: 10.1109/ACCESS.2021.3049880
-
-        Disturb_point = np.array([[0,     0,  0, 0],  # time, BIS signal, MAP, CO signals
-                                  [9.9,   0,  0, 0],
-                                  [10,   20, 10, 0.5],
-                                  [15,   20, 10, 0.5],
-                                  [15.1,  0,  0, 0],
-                                  [19.9,  0,  0, 0],
-                                  [20,   20, 10, 0.5],
-                                  [25,   20, 10, 0.5],
-                                  [25.1,  0,  0, 0],
-                                  [26.9,-20,-10, -0.5],
-                                  [27,   20, 10, 0.5],
-                                  [32,   20, 10, 0.5],
-                                  [32.1,  0,  0, 0],
-                                  [41.9,  0,  0, 0],
-                                  [42,   20, 10, 0.5],
-                                  [44,   20, 10, 0.5],
-                                  [44.1,  0,  0, 0],
-                                  [50,    0,  0, 0],
-                                  [50.1, 20, 10, 0.5],
-                                  [55,   20, 10, 0.5],
-                                  [55.1,  0,  0, 0],
-                                  [75,    0,  0, 0],
-                                  [75.1, 20, 10, 0.5],
-                                  [95,   20, 10, 0.5],
-                                  [95.1,  0,  0, 0],
-                                  [100,   0,  0, 0]])
-        
-    elif dist_profil == 'liverTransplantation':
-         # The events in this major surgery are Intubation, Incision, recipient hepatectomy, donor liver implementation,
-
-        Disturb_point = np.array([[0,     0,  0, 0],  # time, BIS signal, MAP, CO signals
-                                  [9.9,   0,  0, 0],    [10,   20, 10, 0.5],    [13,   20, 10, 0.5],    [13.1,  0,  0, 0],
-                                  [16,    0,  0, 0],    [16.1, 15,  8, 0.4],    [21,   15,  8, 0.4],    [21.1, 20, 10, 0.5],
-                                  [27,   20, 10, 0.5],  [27.1,  0,  0,   0],    [29,    0,  0,   0],    [29.1,  5,  2, 0.1],
-                                  [37,    5,  2, 0.1],  [37.1,  0,  0,   0],    [39,    0,  0,   0],    [39.1,  5,  2, 0.1],
-                                  [46,    5,  2, 0.1],  [46.1,  0,  0,   0],    [51,    0,  0,   0],    [51.1, 10,  5, 0.2], 
-                                  [56,   10,  5, 0.2],  [56.1,  0,  0,   0],    [65,    0,  0,   0],    [65.1, 10,  5, 0.2],
-                                  [69,   10,  5, 0.2],  [69.1,  0,  0,   0],    [78,    0,  0,   0],    [78.1, 10,  5, 0.2],
-                                  [82,   10,  5, 0.2],  [82.1,  0,  0,   0],    [88,    0,  0,   0],    [90,    5,  2, 0.1],
-                                  [114,   5,  2, 0.1],  [114.1, 0,  0,   0],    [116,   0,  0,   0],    [121.5, 0,  0,   0],
-                                  [123.5, 5,  2, 0.1],  [125.5, 0,  0,   0],    [130.5, 0,  0,   0],    [132.5, 5,  2, 0.1],
-                                  [134.5, 0,  0, 0],    [141,   0,  0,   0],    [141.1,10,  5, 0.2],    [145,  10,  5, 0.2],
-                                  [145.1, 0,  0, 0],    [150,   0,  0,   0],    [151,  10,  5, 0.2],    [155,  10,  5, 0.2],
-                                  [156,   5,  2, 0.1],  [157,  10,  5, 0.2],    [161,  10,  5, 0.2],    [162,   0,  0,   0],
-                                  [165,   0,  0, 0],    [166,   5,  2, 0.1],    [169,   5,  2, 0.1],    [169.1,10,  5, 0.2],
-                                  [171,  10,  5, 0.2],  [172,   0,  0,   0],    [173,   0,  0,   0],    [173.5,10,  5, 0.2],
-                                  [174,   0,  0, 0],    [181,   0,  0,   0],    [181.1,15,  8, 0.4],    [183.5,15,  8, 0.4],
-                                  [183.6, 0,  0, 0],    [186,   0,  0,   0],    [186.1,10,  5, 0.2],    [189,  10,  5, 0.2],
-                                  [189.1, 0,  0, 0],    [190,   0,  0,   0],    [190.1, 5,  2, 0.1],    [193,  5,   2, 0.1],
-                                  [193.1, 0,  0, 0],    [196,   0,  0,   0],    [198,   8,  4, 0.1],    [204,  8,   4, 0.1],
-                                  [206,   0,  0, 0],    [208,   0,  0,   0],    [210,  10,  5, 0.2],    [222, 10,   5, 0.2],
-                                  [224,   0,  0, 0],    [226,   5,  2, 0.1],    [227,  12,  6,  0.3],   [232, 12,   6, 0.3],
-                                  [234,   0,  0, 0],    [237,   0,  0,   0],    [238,   8,  4, 0.1],    [251,  8,   4, 0.1],
-                                  [252,   0,  0, 0],    [260,   0,  0,   0],    [263,  15,  8, 0.4],    [270, 15,   8, 0.4],
-                                  [273,   5,  2, 0.1],  [338,   5,  2, 0.1],    [341,  0,  0,    0],    [350,  0,   0,   0]])
-        
-    elif dist_profil == 'simple':
-        # As in G. A. Dumont, A. Martinez, and J. M. Ansermino,
-        # “Robust control of depth of anesthesia,”
-        # International Journal of Adaptive Control and Signal Processing,
-        # vol. 23, no. 5, pp. 435–454, 2009, doi: 10.1002/acs.1087.
-
-        Disturb_point = np.array([[0,     0,  0, 0],  # time, BIS signal, MAP, CO signals
-                                  [19.9,  0,  0, 0],
-                                  [20,   20,  5, 0.3],
-                                  [23,   20, 10, 0.6],
-                                  [24,   15, 10, 0.6],
-                                  [26, 12.5,  6, 0.4],
-                                  [30, 10.5,  4, 0.3],
-                                  [37,   10,  4, 0.3],
-                                  [40,    4,  2, 0.1],
-                                  [45,  0.5, 0.1, 0.01],
-                                  [50,    0,  0,   0]])
-    elif dist_profil == 'step':
-        Disturb_point = np.array([[0,     0,  0,   0],  # time, BIS signal, MAP, CO signals
-                                  [start_step/60-0.01,   0,  0,   0],
-                                  [start_step/60,    10,  5, 0.3],
-                                  [end_step/60-0.01,   10,  5, 0.3],
-                                  [end_step/60,  0,  0,   0],
-                                  [30,    0,  0,   0]])
+    if out is None:
+        out = np.empty(3)
+    try:
+        handler = _DISPATCH[dist_profil]
+    except KeyError:
+        raise ValueError('dist_profil must be one of ' + ', '.join(_DISPATCH)) from None
+    return handler(time, start_step, end_step, out)
+
 
-    elif dist_profil == 'null':
-        return [0, 0, 0]
+def compute_disturbances_array(times: np.ndarray, dist_profil: str = 'realistic',
+                               start_step: float = 600, end_step: float = 1200, out: np.ndarray = None) -> np.ndarray:
+    """
+    Give the values of the distubance profile for a whole time grid.
 
-    dist_bis = np.interp(time/60, Disturb_point[:, 0], Disturb_point[:, 1])
-    dist_map = np.interp(time/60, Disturb_point[:, 0], Disturb_point[:, 2])
-    dist_co = np.interp(time/60, Disturb_point[:, 0], Disturb_point[:, 3])
+    Parameters
+    ----------
+    times : np.ndarray
+        Times: in seconds.
+    dist_profil : str, optional
+        disturbance profile, can be: 'realistic', 'realistic2', 'liverTransplantation', 'simple', 'step' or "null". The default is 'realistic'.
+    start_step : float, optional
+        start time of the step distuebance (seconds). The default is 600s.
+    end_step : float, optional
+        End time of the step distuebance (seconds). The default is 1200s.
+    out : np.ndarray, optional
+        Array of size (len(times), 3) in which the result is written. The default is None, in which case a new
+        array is returned.
+
+    Returns
+    -------
+    np.ndarray
+        Array of size (len(times), 3), each row gives dist_bis, dist_map, dist_co at the corresponding time.
+
+    """
+    times = np.asarray(times, dtype=np.float64).ravel()
+    if out is None:
+        out = np.empty((times.size, 3))
+    if dist_profil == 'null':
+        out[:] = 0
+        return out
+    elif dist_profil == 'step':
+        rise = np.clip((times/60 - start_step/60)/_STEP_RAMP + 1, 0, 1)
+        fall = np.clip((times/60 - end_step/60)/_STEP_RAMP + 1, 0, 1)
+        return np.outer(rise - fall, _STEP_AMPLITUDE, out=out)
+    elif dist_profil in _PROFILES:
+        t_point, y_point = _PROFILES[dist_profil]
+    else:
+        raise ValueError('dist_profil must be one of ' + ', '.join(_DISPATCH))
 
-    return [dist_bis, dist_map, dist_co]
+    for k in range(3):
+        out[:, k] = np.interp(times/60, t_point, y_point[:, k])
+    return out
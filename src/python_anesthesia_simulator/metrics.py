@@ -1,9 +1,102 @@
+import math
+
 import numpy as np
 import pandas as pd
 
 
+def _induction_metrics(time: np.ndarray, bis: np.ndarray, index_end: int) -> tuple:
+    """Compute the induction metrics on the first index_end samples of a BIS trace.
+
+    Parameters
+    ----------
+    time : np.ndarray
+        Time values (s).
+    bis : np.ndarray
+        BIS values over time.
+    index_end : int
+        Number of samples belonging to the induction phase.
+
+    Returns
+    -------
+    tuple
+        TT, BIS_NADIR, ST10, ST20, US. Times are in minutes (nan if not reached). The settling times are the
+        times from which the BIS stays in the band until the end of the induction.
+
+    """
+    time = time[:index_end]
+    bis = bis[:index_end]
+    BIS_NADIR = bis.min()
+    US = max(0, 45 - BIS_NADIR)
+    below_55 = bis < 55
+    TT = time[np.argmax(below_55)]/60 if below_55.any() else np.nan
+    ST10 = _settling_time(time, (bis > 45) & (bis < 55))
+    ST20 = _settling_time(time, (bis > 40) & (bis < 60))
+    return TT, BIS_NADIR, ST10, ST20, US
+
+
+def _maintenance_metrics(time: np.ndarray, bis: np.ndarray, index_start: int, index_end: int,
+                         start_time: float, end_time: float, lag: int = 0) -> tuple:
+    """Compute the disturbance rejection metrics of a BIS trace.
+
+    Parameters
+    ----------
+    time : np.ndarray
+        Time values (s).
+    bis : np.ndarray
+        BIS values over time.
+    index_start : int
+        First index of the positive disturbance.
+    index_end : int
+        First index of the negative disturbance.
+    start_time : float
+        Reference time of the positive disturbance (s).
+    end_time : float
+        Reference time of the negative disturbance (s).
+    lag : int, optional
+        The crossing of sample j is detected on bis[j + lag]. The default is 0.
+
+    Returns
+    -------
+    tuple
+        TTp, BIS_NADIRp, TTn, BIS_NADIRn. Times are in minutes (nan if not reached).
+
+    """
+    BIS_NADIRp = bis[index_start:index_end].min()
+    BIS_NADIRn = bis[index_end:].max()
+    below_55 = bis[index_start+lag:index_end+lag] < 55
+    TTp = (time[index_start + np.argmax(below_55)] - start_time)/60 if below_55.any() else np.nan
+    above_45 = bis[index_end+lag:] > 45
+    TTn = (time[index_end + np.argmax(above_45)] - end_time)/60 if above_45.any() else np.nan
+    return TTp, BIS_NADIRp, TTn, BIS_NADIRn
+
+
+def _settling_time(time: np.ndarray, in_band: np.ndarray) -> float:
+    """Give the time (min) from which in_band stays True until the end of the trace.
+
+    nan is returned if the last sample is not in the band.
+    """
+    if len(in_band) == 0 or not in_band[-1]:
+        return np.nan
+    out_band = ~in_band
+    if not out_band.any():
+        return time[0]/60
+    last_out = len(in_band) - 1 - int(np.argmax(out_band[::-1]))
+    return time[last_out + 1]/60
+
+
+def _time_index(time: np.ndarray, t: float, ts: float = None) -> int:
+    """Give the index of the first sample at or after time t.
+
+    If the sampling time ts is given, the time grid is assumed uniform and the index is computed directly.
+    """
+    if ts is None:
+        return int(np.searchsorted(time, t, side='left'))
+    # small tolerance so that a t lying on the grid up to rounding errors gives its own sample
+    return min(max(int(math.ceil((t - time[0])/ts - 1e-9)), 0), len(time))
+
+
 def compute_control_metrics(time: list, bis: list, phase: str = 'maintenance',
-                            start_step: float = 600, end_step: float = 1200):
+                            start_step: float = 600, end_step: float = 1200, ts: float = None):
     """Compute metrics for closed loop anesthesia.
 
     This function compute the control metrics initially proposed in [Ionescu2008]_.
@@ -21,6 +114,9 @@ def compute_control_metrics(time: list, bis: list, phase: str = 'maintenance',
         Start time of the step disturbance, for maintenance and total phase. The default is 600s.
     end_step: float, optional
         End time of the step disturbance, for maintenance and total phase. The default is 1200s.
+    ts: float, optional
+        Sampling time (s) of a uniform time grid. If given, the step indices are computed directly instead of
+        being searched in time. The default is None.
 
     Returns
     -------
@@ -45,25 +141,10 @@ def compute_control_metrics(time: list, bis: list, phase: str = 'maintenance',
             9, pp. 2161–2170, Sep. 2008, doi: 10.1109/TBME.2008.923142.
 
     """
+    time_arr = np.ascontiguousarray(time, dtype=np.float64)
+    bis_arr = np.ascontiguousarray(bis, dtype=np.float64)
     if phase == 'induction':
-        BIS_NADIR = min(bis)
-        US = max(0, 45 - BIS_NADIR)
-        TT, ST10, ST20 = np.nan, np.nan, np.nan
-        for j in range(len(bis)):
-            if bis[j] < 55:
-                if np.isnan(TT):
-                    TT = time[j]/60
-            if bis[j] < 55 and bis[j] > 45:
-                if np.isnan(ST10):
-                    ST10 = time[j]/60
-            else:
-                ST10 = np.nan
-
-            if bis[j] < 60 and bis[j] > 40:
-                if np.isnan(ST20):
-                    ST20 = time[j]/60
-            else:
-                ST20 = np.nan
+        TT, BIS_NADIR, ST10, ST20, US = _induction_metrics(time_arr, bis_arr, len(bis_arr))
         df = pd.DataFrame([{'TT': TT,
                             'BIS_NADIR': BIS_NADIR,
                             'ST10': ST10,
@@ -73,21 +154,10 @@ def compute_control_metrics(time: list, bis: list, phase: str = 'maintenance',
 
     elif phase == 'maintenance':
         # find start step index
-        index_start = np.where(np.array(time) == start_step)[0][0]+1
-        index_end = np.where(np.array(time) == end_step)[0][0]
-
-        BIS_NADIRp = min(bis[index_start:index_end])
-        BIS_NADIRn = max(bis[index_end:])
-        TTp, TTn = np.nan, np.nan
-        for j in range(index_start, index_end):
-            if bis[j+1] < 55:
-                TTp = (time[j]-start_step)/60
-                break
-
-        for j in range(index_end, len(bis)):
-            if bis[j+1] > 45:
-                TTn = (time[j]-end_step)/60
-                break
+        index_start = _time_index(time_arr, start_step, ts) + 1
+        index_end = _time_index(time_arr, end_step, ts)
+        TTp, BIS_NADIRp, TTn, BIS_NADIRn = _maintenance_metrics(time_arr, bis_arr, index_start, index_end,
+                                                                start_step, end_step, lag=1)
         df = pd.DataFrame([{'TTp': TTp,
                             'BIS_NADIRp': BIS_NADIRp,
                             'TTn': TTn,
@@ -96,42 +166,15 @@ def compute_control_metrics(time: list, bis: list, phase: str = 'maintenance',
 
     elif phase == 'total':
         # consider induction as the first 10 minutes
-        index_10 = np.where(np.array(time) == 10*60)[0][0]
-        bis_induction = bis[:index_10]
-        BIS_NADIR = min(bis_induction)
-        US = max(0, 45 - BIS_NADIR)
-        TT, ST10, ST20 = np.nan, np.nan, np.nan
-        for j in range(index_10):
-            if bis_induction[j] < 55:
-                if np.isnan(TT):
-                    TT = time[j]/60
-            if bis_induction[j] < 55 and bis_induction[j] > 45:
-                if np.isnan(ST10):
-                    ST10 = time[j]/60
-            else:
-                ST10 = np.nan
-
-            if bis_induction[j] < 60 and bis_induction[j] > 40:
-                if np.isnan(ST20):
-                    ST20 = time[j]/60
-            else:
-                ST20 = np.nan
+        index_10 = _time_index(time_arr, 10*60, ts)
+        TT, BIS_NADIR, ST10, ST20, US = _induction_metrics(time_arr, bis_arr, index_10)
         # Maintenance phase
         # find start step index
-        index_start = np.where(np.array(time) == start_step)[0][0] + 1
-        index_end = np.where(np.array(time) == end_step)[0][0] + 1
-        BIS_NADIRp = min(bis[index_start:index_end])
-        BIS_NADIRn = max(bis[index_end:])
-        TTp, TTn = np.nan, np.nan
-        for j in range(index_start, index_end):
-            if bis[j] < 55:
-                TTp = (time[j]-start_step)/60
-                break
-
-        for j in range(index_end, len(bis)):
-            if bis[j] > 45:
-                TTn = (time[j]-time[index_end])/60
-                break
+        index_start = _time_index(time_arr, start_step, ts) + 1
+        index_end = _time_index(time_arr, end_step, ts) + 1
+        end_time = time_arr[index_end] if index_end < len(time_arr) else np.nan
+        TTp, BIS_NADIRp, TTn, BIS_NADIRn = _maintenance_metrics(time_arr, bis_arr, index_start, index_end,
+                                                                start_step, end_time)
         df = pd.DataFrame([{'TT': TT,
                             'BIS_NADIR': BIS_NADIR,
                             'ST10': ST10,
@@ -144,17 +187,17 @@ def compute_control_metrics(time: list, bis: list, phase: str = 'maintenance',
         return df
 
 
-def intergal_absolut_error(time: list, bis: list, bis_target: float = 50):
+def intergal_absolut_error(time: np.ndarray, bis: np.ndarray, bis_target: float = 50):
     """Compute the integral of the absolute error.
 
     This function compute the integral of the absolute error between the BIS value and the target value.
 
     Parameters
     ----------
-    time : list
-        List of time value (s).
-    bis : list
-        List of BIS value over time.
+    time : np.ndarray
+        Array of time value (s). Lists are accepted but converted at each call.
+    bis : np.ndarray
+        Array of BIS value over time. Lists are accepted but converted at each call.
     bis_target : float, optional
         Target BIS value. The default is 50.
 
@@ -164,11 +207,24 @@ def intergal_absolut_error(time: list, bis: list, bis_target: float = 50):
         Integral of the absolute error.
 
     """
-    iae = np.trapezoid(np.abs(np.array(bis)-bis_target), time)
+    bis_arr = np.asarray(bis, dtype=np.float64)
+    time_arr = np.asarray(time, dtype=np.float64)
+    iae = np.trapezoid(np.abs(bis_arr - bis_target), time_arr)
     return iae
 
 
-def new_metrics_induction(time: np.ndarray, bis: np.ndarray):
+def _last_exit_time(time: np.ndarray, mask: np.ndarray) -> float:
+    """Give the time (min) of the sample following the last True value of mask.
+
+    If the last True value is the last sample, its own time is returned. If mask is never True, nan is returned.
+    """
+    if not mask.any():
+        return np.nan
+    last = len(mask) - 1 - int(np.argmax(mask[::-1]))
+    return time[min(last + 1, len(mask) - 1)]/60
+
+
+def new_metrics_induction(time: np.ndarray, bis: np.ndarray, ts: float = None):
     """Compute new metrics for induction of closed loop anesthesia.
 
     This function compute new metrics for closed loop anesthesia.
@@ -179,6 +235,8 @@ def new_metrics_induction(time: np.ndarray, bis: np.ndarray):
         List of time value (s).
     bis : list
         List of BIS value over time.
+    ts : float, optional
+        Sampling time (s). The default is None, in which case it is deduced from the first two time values.
 
     Returns
     -------
@@ -192,43 +250,31 @@ def new_metrics_induction(time: np.ndarray, bis: np.ndarray):
         - **Settling time** (*float*): Time to reach BIS < 60 and stay within [40, 60] (minutes).
 
     """
+    time_arr = np.ascontiguousarray(time, dtype=np.float64)
+    bis_arr = np.ascontiguousarray(bis, dtype=np.float64)
     results = {}
     # Integral of the absolute error
-    iae = intergal_absolut_error(time, bis)
+    iae = intergal_absolut_error(time_arr, bis_arr)
     results['IAE'] = iae
     # Sleep time
-    sleep_time = np.nan
-    for j in range(len(bis)-1, -1, -1):
-        if bis[j] > 60:
-            if j == len(bis)-1:
-                sleep_time = time[j]/60
-            else:
-                sleep_time = time[j+1]/60
-            break
+    sleep_time = _last_exit_time(time_arr, bis_arr > 60)
     results['Sleep_Time'] = sleep_time
     # Low BIS time
-    ts = time[1] - time[0]
-    low_bis_index = np.where(np.array(bis) < 40)[0]
-    low_bis_time = len(low_bis_index)*ts
+    if ts is None:
+        ts = float(time_arr[1] - time_arr[0])
+    low_bis_time = int((bis_arr < 40).sum())*ts
     results['Low BIS time'] = low_bis_time
     # Lowest BIS
-    lowest_bis = min(bis)
+    lowest_bis = bis_arr.min()
     results['Lowest BIS'] = lowest_bis
     # Settling time
-    settling_time = np.nan
-    for j in range(len(bis)-1, -1, -1):
-        if bis[j] > 60 or bis[j] < 40:
-            if j == len(bis)-1:
-                settling_time = time[j]/60
-            else:
-                settling_time = time[j+1]/60
-            break
+    settling_time = _last_exit_time(time_arr, (bis_arr > 60) | (bis_arr < 40))
     results['Settling time'] = settling_time
     df = pd.DataFrame([results])
     return df
 
 
-def new_metrics_maintenance(time: np.ndarray, bis: np.ndarray):
+def new_metrics_maintenance(time: np.ndarray, bis: np.ndarray, ts: float = None):
     """Compute new metrics for maintenance of closed loop anesthesia.
 
     Parameters
@@ -237,7 +283,8 @@ def new_metrics_maintenance(time: np.ndarray, bis: np.ndarray):
         List of time value (s).
     bis : list
         List of BIS value over time.
-
+    ts : float, optional
+        Sampling time (s). The default is None, in which case it is deduced from the first two time values.
 
     Returns
     -------
@@ -251,21 +298,21 @@ def new_metrics_maintenance(time: np.ndarray, bis: np.ndarray):
 
 
     """
-    IAE = intergal_absolut_error(time, bis)
+    time_arr = np.ascontiguousarray(time, dtype=np.float64)
+    bis_arr = np.ascontiguousarray(bis, dtype=np.float64)
+    IAE = intergal_absolut_error(time_arr, bis_arr)
     results = {}
     results['IAE'] = IAE
     # Time out of range
-    ts = time[1] - time[0]
-    out_range_index = np.where(np.array(bis) < 40)[0]
-    out_range_time = len(out_range_index)*ts
-    out_range_index = np.where(np.array(bis) > 60)[0]
-    out_range_time += len(out_range_index)*ts
+    if ts is None:
+        ts = float(time_arr[1] - time_arr[0])
+    out_range_time = int(((bis_arr < 40) | (bis_arr > 60)).sum())*ts
     results['Time out of range'] = out_range_time
     # Lowest BIS
-    lowest_bis = min(bis)
+    lowest_bis = bis_arr.min()
     results['Lowest BIS'] = lowest_bis
     # Highest BIS
-    highest_bis = max(bis)
+    highest_bis = bis_arr.max()
     results['Highest BIS'] = highest_bis
     df = pd.DataFrame([results])
     return df
@@ -1,13 +1,80 @@
+import math
 from typing import Optional
+from collections import namedtuple
+from types import SimpleNamespace
 
 import numpy as np
-import control
 import casadi as cas
-from matplotlib import pyplot as plt
-from matplotlib import cm
 
 
-def fsig(x, c50, gam): return x**gam/(c50**gam + x**gam)  # quick definition of sigmoidal function
+def fsig(x, c50, gam):
+    """Quick definition of sigmoidal function, with a single power evaluation."""
+    t = (x/c50)**gam
+    return t/(1 + t)
+
+
+def fsig1(x, c50):
+    """Sigmoidal function with a slope of 1, equal to fsig(x, c50, 1) without the power evaluation."""
+    t = x/c50
+    return t/(1 + t)
+
+
+HillParam = namedtuple('HillParam', 'c50p c50r gamma beta E0 Emax')
+HillParam.__doc__ = "Parameters of the BIS model: (c50p, c50r, gamma, beta, E0, Emax)."
+
+
+# coefficient of variation of the BIS model parameters (c50p, c50r, gamma, beta, E0, Emax),
+# see the references given with the nominal values in BIS_model.__init__
+_BIS_CV = {
+    'Bouillon': HillParam(0.182, 0.888, 0.304, 0, 0, 0),
+    'Vanluchene': HillParam(0.34, 0, 0.32, 0, 0.04, 0.11),
+    'Eleveld': HillParam(0.523, 0, 0, 0, 0, 0),
+}
+
+
+# decrease of c50p per unit of blood volume lost, see [Johnson2003] in BIS_model.update_param_blood_loss
+_C50P_BLOOD_LOSS_SLOPE = 3/0.5
+
+
+def _bis_random_factor(hill_model: str, size: Optional[int] = None) -> np.ndarray:
+    """Draw the log normal variability factors of the BIS model parameters.
+
+    The factors are returned in the draw order (c50p, c50r, beta, gamma, E0, Emax), with one row per patient if
+    size is given. Rows are drawn one after the other, as if the patients were generated one by one.
+    """
+    cv = _BIS_CV[hill_model]
+    # estimation of log normal standard deviation
+    w = np.sqrt(np.log(1 + np.array([cv.c50p, cv.c50r, cv.beta, cv.gamma, cv.E0, cv.Emax])**2))
+    if size is not None:
+        size = (size, 6)
+    return np.random.lognormal(sigma=w, size=size)
+
+
+def _largest_positive_cubic_root(b, c, d):
+    """Largest positive real root of x**3 + b*x**2 + c*x + d, or 0 if there is none.
+
+    The roots are computed in closed form (Cardano / trigonometric method), element-wise for array coefficients.
+    """
+    b, c, d = np.broadcast_arrays(np.asarray(b, dtype=float), np.asarray(c, dtype=float),
+                                  np.asarray(d, dtype=float))
+    # depressed cubic y**3 + p*y + q with x = y - s
+    s = b/3
+    p = c - b*s
+    q = (2*s*s - c)*s + d
+    disc = (q/2)**2 + (p/3)**3
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # one real root
+        u = np.cbrt(-q/2 - np.copysign(np.sqrt(np.maximum(disc, 0)), q))
+        y_single = np.where(u != 0, u - p/(3*u), 0)
+        # three real roots
+        m = 2*np.sqrt(np.maximum(-p/3, 0))
+        theta = np.arccos(np.clip(-4*q/m**3, -1, 1))/3
+    three_roots = disc < 0
+    roots = np.stack([np.where(three_roots, m*np.cos(theta), y_single),
+                      np.where(three_roots, m*np.cos(theta - 2*np.pi/3), np.nan),
+                      np.where(three_roots, m*np.cos(theta - 4*np.pi/3), np.nan)]) - s
+    root = np.where(roots > 0, roots, 0).max(axis=0)
+    return root[()]
 
 
 class BIS_model:
@@ -66,9 +133,10 @@ class BIS_model:
         initial BIS.
     Emax : float
         max effect of the drugs on BIS.
-    hill_param : list
+    hill_param : HillParam
         Parameters of the model
-        list [c50p_BIS, c50r_BIS, gamma_BIS, beta_BIS, E0_BIS, Emax_BIS]
+        named tuple (c50p, c50r, gamma, beta, E0, Emax), can be indexed as the list
+        [c50p_BIS, c50r_BIS, gamma_BIS, beta_BIS, E0_BIS, Emax_BIS]
     c50p_init : float
         Initial value of c50p, used for blood loss modelling.
     hill_model : str
@@ -92,6 +160,9 @@ class BIS_model:
 
     """
 
+    __slots__ = ('hill_model', 'c50p', 'c50r', 'gamma', 'beta', 'E0', 'Emax',
+                 'hill_param', 'c50p_init', '_has_remi')
+
     def __init__(self, hill_model: str = 'Bouillon', hill_param: Optional[list] = None,
                  random: Optional[bool] = False, **kwargs):
         """
@@ -126,14 +197,6 @@ class BIS_model:
             self.E0 = 97.4
             self.Emax = self.E0
 
-            # coefficient of variation
-            cv_c50p = 0.182
-            cv_c50r = 0.888
-            cv_gamma = 0.304
-            cv_beta = 0
-            cv_E0 = 0
-            cv_Emax = 0
-
         elif self.hill_model == 'Vanluchene':
             # See [Vanluchene2004]  A. L. G. Vanluchene et al., “Spectral entropy as an electroencephalographic measure
             # of anesthetic drug effect: a comparison with bispectral index and processed midlatency auditory evoked
@@ -146,14 +209,6 @@ class BIS_model:
             self.beta = 0
             self.E0 = 95.9
             self.Emax = 87.5
-
-            # coefficient of variation
-            cv_c50p = 0.34
-            cv_c50r = 0
-            cv_gamma = 0.32
-            cv_beta = 0
-            cv_E0 = 0.04
-            cv_Emax = 0.11
             
         elif self.hill_model == 'Eleveld':
            # [Eleveld2018] D. J. Eleveld, P. Colin, A. R. Absalom, and M. M. R. F. Struys,
@@ -167,47 +222,31 @@ class BIS_model:
            # reference patient
            AGE_ref = 35
            
-           # function used in the model
-           def faging(x): return np.exp(x * (age - AGE_ref))
-
-           self.c50p = 3.08*faging(-0.00635)
+           # ageing effect on c50p, scalar so math.exp is enough
+           self.c50p = 3.08*math.exp(-0.00635 * (age - AGE_ref))
            self.c50r = 0
            self.gamma = 1.89
            self.beta = 0
            self.E0 = 93
            self.Emax = self.E0
 
-           # coefficient of variation
-           cv_c50p = 0.523
-           cv_c50r = 0
-           cv_gamma = 0
-           cv_beta = 0
-           cv_E0 = 0
-           cv_Emax = 0     
-
-        if random and hill_param is None:
-            # estimation of log normal standard deviation
-            w_c50p = np.sqrt(np.log(1+cv_c50p**2))
-            w_c50r = np.sqrt(np.log(1+cv_c50r**2))
-            w_gamma = np.sqrt(np.log(1+cv_gamma**2))
-            w_beta = np.sqrt(np.log(1+cv_beta**2))
-            w_E0 = np.sqrt(np.log(1+cv_E0**2))
-            w_Emax = np.sqrt(np.log(1+cv_Emax**2))
-
         if random and hill_param is None:
-            self.c50p *= np.exp(np.random.normal(scale=w_c50p))
-            self.c50r *= np.exp(np.random.normal(scale=w_c50r))
-            self.beta *= np.exp(np.random.normal(scale=w_beta))
-            self.gamma *= np.exp(np.random.normal(scale=w_gamma))
-            self.E0 *= min(100, np.exp(np.random.normal(scale=w_E0)))
-            self.Emax *= np.exp(np.random.normal(scale=w_Emax))
-
-        self.hill_param = [self.c50p, self.c50r, self.gamma, self.beta, self.E0, self.Emax]
+            factor = _bis_random_factor(self.hill_model)
+            self.c50p *= factor[0]
+            self.c50r *= factor[1]
+            self.beta *= factor[2]
+            self.gamma *= factor[3]
+            self.E0 *= min(100, factor[4])
+            self.Emax *= factor[5]
+
+        self.hill_param = HillParam(self.c50p, self.c50r, self.gamma, self.beta, self.E0, self.Emax)
         self.c50p_init = self.c50p  # for blood loss modelling
+        self._has_remi = self.c50r != 0  # True if the model takes into account the interaction with Remifentanil
 
     def compute_bis(self, c_es_propo: float, c_es_remi: Optional[float] = 0) -> float:
         """Compute BIS function from Propofol (and optionally Remifentanil) effect site concentration.
         If the BIS model chosen considers only the effect of propofol the effect site concentration of remifentanil is ignored.
+        The concentrations can be given as arrays of the same shape, the BIS is then computed element-wise.
 
         Parameters
         ----------
@@ -222,28 +261,34 @@ class BIS_model:
             Bis value.
 
         """
-        
-        if self.c50r == 0:
+        gamma = self.gamma
+        if not self._has_remi:
             interaction = c_es_propo / self.c50p
 
-            if self.hill_model == 'Eleveld':  
-                if c_es_propo <= self.c50p:
-                    self.gamma = 1.89
-                else:
-                    self.gamma = 1.47
-            
-        elif self.c50r != 0: 
+            if self.hill_model == 'Eleveld':
+                gamma = self._eleveld_gamma_from_ce(c_es_propo)
+
+        else:
             up = c_es_propo / self.c50p
             ur = c_es_remi / self.c50r
             Phi = up/(up + ur + 1e-6)
             U_50 = 1 - self.beta * (Phi - Phi**2)
             interaction = (up + ur)/U_50
 
-        bis = self.E0 - self.Emax * interaction ** self.gamma / (1 + interaction ** self.gamma)
+        t = interaction ** gamma
+        bis = self.E0 - self.Emax * t / (1 + t)
 
         return bis
 
 
+    def _eleveld_gamma_from_ce(self, c_es_propo: float) -> float:
+        """Slope of the Eleveld model, which is higher below the propofol concentration at half effect."""
+        return np.where(np.asarray(c_es_propo) <= self.c50p, 1.89, 1.47)
+
+    def _eleveld_gamma_from_bis(self, BIS: float) -> float:
+        """Slope of the Eleveld model, selected on the BIS reached at half effect."""
+        return np.where(np.asarray(BIS) >= self.E0 - self.Emax/2, 1.89, 1.47)
+
     def update_param_blood_loss(self, v_ratio: float):
         """Update PK coefficient to mimic a blood loss.
 
@@ -251,8 +296,9 @@ class BIS_model:
 
         Parameters
         ----------
-        v_loss : float
+        v_loss : float or np.ndarray
             blood volume as a fraction of init volume, 1 mean no loss, 0 mean 100% loss.
+            An array of ratios gives an array of c50p, one per blood loss scenario.
 
         Returns
         -------
@@ -265,84 +311,91 @@ class BIS_model:
                 doi: 10.1097/00000542-200308000-00023.
 
         """
-        self.c50p = self.c50p_init - 3/0.5*(1-v_ratio)
+        self.c50p = self.c50p_init - _C50P_BLOOD_LOSS_SLOPE*(1 - np.asarray(v_ratio))
 
     def inverse_hill(self, BIS: float, c_es_remi: Optional[float] = 0) -> float:
         """Compute Propofol effect site concentration from BIS (and optionally Remifentanil effect site concentration if the BIS model chosen takes into acount interaction) .
 
+        Both inputs can also be given as arrays, they are broadcast together.
+
         Parameters
         ----------
-        BIS : float
+        BIS : float or np.ndarray
             BIS value.
-        cer : float, optional
+        cer : float or np.ndarray, optional
             Effect site Remifentanil concentration (ng/mL). The default is 0.
 
         Returns
         -------
-        cep : float
-            Effect site Propofol concentration (µg/mL).
+        cep : float or np.ndarray
+            Effect site Propofol concentration (µg/mL). For the interaction model it is 0 when the
+            Remifentanil concentration alone already reaches the BIS value (no positive root).
 
         """
-        
-        if self.c50r == 0:
+        BIS = np.asarray(BIS, dtype=float)
+        if not self._has_remi:
             # If the Eleveld model is selected select the slope according to 
             # the value of the BIS. Ce50 is the value at which 50% of the Emax
             # is reached. So I check this condition on the BIS.
-            if self.hill_model == 'Eleveld':  
-                if BIS >= (self.E0-(self.Emax/2)):
-                    self.gamma = 1.89
-                else:
-                    self.gamma = 1.47
-                    
-            cep = self.c50p * ((self.E0-BIS)/(self.Emax-self.E0+BIS))**(1/self.gamma)
+            gamma = self.gamma
+            if self.hill_model == 'Eleveld':
+                gamma = self._eleveld_gamma_from_bis(BIS)
+
+            cep = (self.c50p * ((self.E0-BIS)/(self.Emax-self.E0+BIS))**(1/gamma))[()]
             
-        elif self.c50r != 0:
-            temp = (max(0, self.E0-BIS)/(self.Emax-self.E0+BIS))**(1/self.gamma)
-            Yr = c_es_remi / self.c50r
+        else:
+            temp = (np.maximum(0, self.E0-BIS)/(self.Emax-self.E0+BIS))**(1/self.gamma)
+            Yr = np.asarray(c_es_remi, dtype=float) / self.c50r
             b = 3*Yr - temp
             c = 3*Yr**2 - (2 - self.beta) * Yr * temp
             d = Yr**3 - Yr**2*temp
 
-            p = np.poly1d([1, b, c, d])
-
-            real_root = 0
-            try:
-                for el in np.roots(p):
-                    if np.real(el) == el and np.real(el) > 0:
-                        real_root = np.real(el)
-                        break
-                cep = real_root*self.c50p
-            except Exception as e:
-                print(f'bug: {e}')
-                            
+            # d = Yr**2*(Yr - temp) < 0 ensures a positive root, otherwise
+            # Remifentanil alone is enough and no Propofol is needed.
+            cep = _largest_positive_cubic_root(b, c, d)*self.c50p
+
         return cep
 
+    def _surface_data(self) -> tuple:
+        """Compute the data plotted by plot_surface.
+
+        Returns
+        -------
+        cer : np.ndarray or None
+            Grid of Remifentanil effect site concentration (ng/mL), None if the model does not consider Remifentanil.
+        cep : np.ndarray
+            Grid of Propofol effect site concentration (µg/mL).
+        effect : np.ndarray
+            BIS value on the grid.
+
+        """
+        if not self._has_remi:
+            cer = None
+            cep = np.linspace(0, 16, 17, dtype=np.float32)
+            effect = self.compute_bis(cep)
+        else:
+            cer = np.linspace(0, 8, 9, dtype=np.float32)
+            cep = np.linspace(0, 12, 13, dtype=np.float32)
+            cer, cep = np.meshgrid(cer, cep)
+            effect = self.compute_bis(cep, cer)
+        return cer, cep, effect
+
     def plot_surface(self):
         """Plot the 3D-Hill surface of the BIS related to Propofol and Remifentanil effect site concentration or the 2-D Hill curve of the BIS related to Propofol effect site concentration according to the BIS model chosen"""
+        from matplotlib import pyplot as plt
+        from matplotlib import cm
 
-        if self.c50r == 0:
-            cep = np.linspace(0, 16, 17)
-            if self.hill_model == 'Eleveld':
-                bis = np.linspace(0, 16, 17)
-                i = 0;
-                for value in cep:
-                    bis[i] = self.compute_bis(value)
-                    i = i+1
-            else:
-                bis = self.compute_bis(cep)
+        cer, cep, effect = self._surface_data()
+        if cer is None:
             plt.figure()
-            plt.plot(cep, bis)
+            plt.plot(cep, effect)
             plt.xlabel('Propofol Ce [μg/mL]')
             plt.ylabel('BIS')
             plt.grid(True)
             plt.ylim(0, 100)
             plt.show()
 
-        elif self.c50r != 0:
-            cer = np.linspace(0, 8, 9)
-            cep = np.linspace(0, 12, 13)
-            cer, cep = np.meshgrid(cer, cep)
-            effect = self.compute_bis(cep, cer)
+        else:
             fig, ax = plt.subplots(subplot_kw={"projection": "3d"})
             surf = ax.plot_surface(cer, cep, effect, cmap=cm.jet, linewidth=0.1)
             ax.set_xlabel('Remifentanil Ce [ng/mL]')
@@ -353,8 +406,84 @@ class BIS_model:
             fig.colorbar(surf, shrink=0.5, aspect=8)
             ax.view_init(20, 60, 0)
             plt.show()
-            
-        
+
+
+class BIS_population:
+    r"""Struct-of-arrays version of BIS_model for a population of N virtual patients.
+
+    Each parameter is stored as an array of shape (N,) so that the BIS of the whole population is computed in a single
+    vectorized call. The equations are the ones of :class:`BIS_model`.
+
+    Parameters
+    ----------
+    N : int
+        Number of patients in the population.
+    hill_model : str, optional
+        'Bouillon', 'Vanluchene' or 'Eleveld', see :class:`BIS_model`. Default is 'Bouillon'.
+    random : bool, optional
+        Add uncertainties in the parameters. With the same seed, the patients are the ones obtained by creating N
+        BIS_model(random=True) one after the other. The default is True.
+    **kwargs
+        age (yr), needed for the Eleveld model.
+
+    Attributes
+    ----------
+    c50p : np.ndarray
+        Concentration at half effect for propofol effect on BIS (µg/mL).
+    c50r : np.ndarray
+        Concentration at half effect for remifentanil effect on BIS (ng/mL).
+    gamma : np.ndarray
+        slope coefficient for the BIS  model.
+    beta : np.ndarray
+        interaction coefficient for the BIS model.
+    E0 : np.ndarray
+        initial BIS.
+    Emax : np.ndarray
+        max effect of the drugs on BIS.
+    hill_param : HillParam
+        Named tuple of the parameter arrays (c50p, c50r, gamma, beta, E0, Emax).
+    c50p_init : np.ndarray
+        Initial value of c50p, used for blood loss modelling.
+    hill_model : str
+        Name of the BIS model.
+
+    """
+
+    __slots__ = ('hill_model', 'c50p', 'c50r', 'gamma', 'beta', 'E0', 'Emax',
+                 'hill_param', 'c50p_init', '_has_remi')
+
+    def __init__(self, N: int, hill_model: str = 'Bouillon', random: Optional[bool] = True, **kwargs):
+        """
+        Init the class.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.hill_model = hill_model
+        nominal = BIS_model(hill_model=hill_model, **kwargs).hill_param
+        param = np.tile(np.array(nominal, dtype=float), (N, 1))
+        if random:
+            factor = _bis_random_factor(hill_model, size=N)
+            param[:, 0] *= factor[:, 0]
+            param[:, 1] *= factor[:, 1]
+            param[:, 3] *= factor[:, 2]
+            param[:, 2] *= factor[:, 3]
+            param[:, 4] *= np.minimum(100, factor[:, 4])
+            param[:, 5] *= factor[:, 5]
+
+        self.c50p, self.c50r, self.gamma, self.beta, self.E0, self.Emax = param.T.copy()
+        self.hill_param = HillParam(self.c50p, self.c50r, self.gamma, self.beta, self.E0, self.Emax)
+        self.c50p_init = self.c50p.copy()  # for blood loss modelling
+        self._has_remi = nominal.c50r != 0
+
+    # the BIS_model equations broadcast over the parameter arrays
+    compute_bis = BIS_model.compute_bis
+    inverse_hill = BIS_model.inverse_hill
+    update_param_blood_loss = BIS_model.update_param_blood_loss
+    _eleveld_gamma_from_ce = BIS_model._eleveld_gamma_from_ce
+    _eleveld_gamma_from_bis = BIS_model._eleveld_gamma_from_bis
 
 
 class TOL_model():
@@ -391,6 +520,8 @@ class TOL_model():
 
     """
 
+    __slots__ = ('c50p', 'c50r', 'gamma_r', 'gamma_p', 'pre_intensity', '_c50r_pi')
+
     def __init__(
             self,
             model: Optional[str] = 'Bouillon',
@@ -428,11 +559,14 @@ class TOL_model():
             w_pre_intensity = np.sqrt(np.log(1+cv_pre_intensity**2))
 
         if random and model_param is None:
-            self.c50p *= np.exp(np.random.normal(scale=w_c50p))
-            self.c50r *= np.exp(np.random.normal(scale=w_c50r))
-            self.gamma_r *= np.exp(np.random.normal(scale=w_gamma_p))
-            self.gamma_p *= np.exp(np.random.normal(scale=w_gamma_r))
-            self.pre_intensity *= np.exp(np.random.normal(scale=w_pre_intensity))
+            factor = np.random.lognormal(sigma=[w_c50p, w_c50r, w_gamma_p, w_gamma_r, w_pre_intensity])
+            self.c50p *= factor[0]
+            self.c50r *= factor[1]
+            self.gamma_r *= factor[2]
+            self.gamma_p *= factor[3]
+            self.pre_intensity *= factor[4]
+
+        self._c50r_pi = self.c50r * self.pre_intensity  # remifentanil c50 scaled by the preopioid intensity
 
     def compute_tol(self, c_es_propo: float, c_es_remi: float) -> float:
         """Return TOL from Propofol and Remifentanil effect site concentration.
@@ -454,16 +588,35 @@ class TOL_model():
             TOL value.
 
         """
-        post_opioid = self.pre_intensity * (1 - fsig(c_es_remi, self.c50r*self.pre_intensity, self.gamma_r))
+        post_opioid = self.pre_intensity * (1 - fsig(c_es_remi, self._c50r_pi, self.gamma_r))
         tol = fsig(c_es_propo, self.c50p*post_opioid, self.gamma_p)
         return tol
 
-    def plot_surface(self):
-        """Plot the 3D-Hill surface of the BIS related to Propofol and Remifentanil effect site concentration."""
-        cer = np.linspace(0, 20, 50)
-        cep = np.linspace(0, 8, 50)
+    def _surface_data(self) -> tuple:
+        """Compute the data plotted by plot_surface.
+
+        Returns
+        -------
+        cer : np.ndarray
+            Grid of Remifentanil effect site concentration (ng/mL).
+        cep : np.ndarray
+            Grid of Propofol effect site concentration (µg/mL).
+        effect : np.ndarray
+            TOL value on the grid.
+
+        """
+        cer = np.linspace(0, 20, 50, dtype=np.float32)
+        cep = np.linspace(0, 8, 50, dtype=np.float32)
         cer, cep = np.meshgrid(cer, cep)
         effect = self.compute_tol(cep, cer)
+        return cer, cep, effect
+
+    def plot_surface(self):
+        """Plot the 3D-Hill surface of the TOL related to Propofol and Remifentanil effect site concentration."""
+        from matplotlib import pyplot as plt
+        from matplotlib import cm
+
+        cer, cep, effect = self._surface_data()
         fig, ax = plt.subplots(subplot_kw={"projection": "3d"})
         surf = ax.plot_surface(cer, cep, effect, cmap=cm.jet, linewidth=0.1)
         ax.set_xlabel('Remifentanil')
@@ -590,6 +743,16 @@ class Hemo_simple_PD_model():
 
     """
 
+    __slots__ = ('co_base', 'map_base',
+                 'emax_nore_map', 'c50_nore_map', 'gamma_nore_map', 'gamma_nore_ma',
+                 'emax_nore_co', 'c50_nore_co', 'gamma_nore_co',
+                 'emax_propo_SAP', 'emax_propo_DAP', 'c50_propo_map_1', 'gamma_propo_map_1',
+                 'c50_propo_map_2', 'gamma_propo_map_2',
+                 'emax_propo_co', 'c50_propo_co', 'gamma_propo_co',
+                 'emax_remi_map', 'c50_remi_map', 'gamma_remi_map', 'gamma_remi_ma',
+                 'emax_remi_co', 'c50_remi_co', 'gamma_remi_co',
+                 '_propo_map_coef', 'map', 'co')
+
     def __init__(self, nore_param: list = None, propo_param: list = None,
                  remi_param: list = None, random: bool = False,
                  co_base: float = 6.5, map_base: float = 90):
@@ -736,40 +899,56 @@ class Hemo_simple_PD_model():
             w_gamma_remi_co = 0
 
         if random:
+            # one call for all the draws, in the same order as one call per parameter
+            eta = np.random.normal(scale=[w_emax_nore_map, w_c50_nore_map, w_gamma_nore_map,
+                                          std_emax_nore_co, w_c50_nore_co, w_gamma_nore_co,
+                                          w_emax_propo_SAP, w_emax_propo_DAP,
+                                          w_c50_propo_map_1, w_gamma_propo_map_1,
+                                          w_c50_propo_map_2, w_gamma_propo_map_2,
+                                          std_emax_propo_co, w_c50_propo_co, w_gamma_propo_co,
+                                          w_emax_remi_map, w_c50_remi_map, w_gamma_remi_map,
+                                          w_emax_remi_co, w_c50_remi_co, w_gamma_remi_co])
+            factor = np.exp(eta)
             # Norepinephrine
-            self.emax_nore_map *= np.exp(np.random.normal(scale=w_emax_nore_map))
-            self.c50_nore_map *= np.exp(np.random.normal(scale=w_c50_nore_map))
-            self.gamma_nore_map *= np.exp(np.random.normal(scale=w_gamma_nore_map))
+            self.emax_nore_map *= factor[0]
+            self.c50_nore_map *= factor[1]
+            self.gamma_nore_map *= factor[2]
 
-            self.emax_nore_co += np.random.normal(scale=std_emax_nore_co)
-            self.c50_nore_co *= np.exp(np.random.normal(scale=w_c50_nore_co))
-            self.gamma_nore_co *= np.exp(np.random.normal(scale=w_gamma_nore_co))
+            self.emax_nore_co += eta[3]
+            self.c50_nore_co *= factor[4]
+            self.gamma_nore_co *= factor[5]
 
             # Propofol
-            self.emax_propo_SAP *= np.exp(np.random.normal(scale=w_emax_propo_SAP))
-            self.emax_propo_DAP *= np.exp(np.random.normal(scale=w_emax_propo_DAP))
-            self.c50_propo_map_1 *= np.exp(np.random.normal(scale=w_c50_propo_map_1))
-            self.gamma_propo_map_1 *= min(3, np.exp(np.random.normal(scale=w_gamma_propo_map_1)))
-            self.c50_propo_map_2 *= np.exp(np.random.normal(scale=w_c50_propo_map_2))
-            self.gamma_propo_map_2 *= min(3, np.exp(np.random.normal(scale=w_gamma_propo_map_2)))
+            self.emax_propo_SAP *= factor[6]
+            self.emax_propo_DAP *= factor[7]
+            self.c50_propo_map_1 *= factor[8]
+            self.gamma_propo_map_1 *= min(3, factor[9])
+            self.c50_propo_map_2 *= factor[10]
+            self.gamma_propo_map_2 *= min(3, factor[11])
 
-            self.emax_propo_co += np.random.normal(scale=std_emax_propo_co)
-            self.c50_propo_co *= np.exp(np.random.normal(scale=w_c50_propo_co))
-            self.gamma_propo_co *= np.exp(np.random.normal(scale=w_gamma_propo_co))
+            self.emax_propo_co += eta[12]
+            self.c50_propo_co *= factor[13]
+            self.gamma_propo_co *= factor[14]
 
             # Remifentanil
-            self.emax_remi_map *= np.exp(np.random.normal(scale=w_emax_remi_map))
-            self.c50_remi_map *= np.exp(np.random.normal(scale=w_c50_remi_map))
-            self.gamma_remi_map *= np.exp(np.random.normal(scale=w_gamma_remi_map))
+            self.emax_remi_map *= factor[15]
+            self.c50_remi_map *= factor[16]
+            self.gamma_remi_map *= factor[17]
+
+            self.emax_remi_co *= factor[18]
+            self.c50_remi_co *= factor[19]
+            self.gamma_remi_co *= factor[20]
 
-            self.emax_remi_co *= np.exp(np.random.normal(scale=w_emax_remi_co))
-            self.c50_remi_co *= np.exp(np.random.normal(scale=w_c50_remi_co))
-            self.gamma_remi_co *= np.exp(np.random.normal(scale=w_gamma_remi_co))
+        # MAP gain of the propofol interaction term, fixed once the parameters are drawn
+        self._propo_map_coef = - (self.emax_propo_DAP + (self.emax_propo_SAP + self.emax_propo_DAP) / 3)
 
     def compute_hemo(self, c_es_propo: list, c_es_remi: float, c_es_nore: float) -> tuple[float, float]:
         """
         Compute current MAP and CO using addition of hill curves, one for each drug.
 
+        All the operations are element-wise, so a full time series can be evaluated in one call
+        by giving c_es_propo as an array of shape (2, T) and the other concentrations as arrays of shape (T,).
+
         Parameters
         ----------
         c_es_propo : list
@@ -790,7 +969,7 @@ class Hemo_simple_PD_model():
         map_nore = self.emax_nore_map * fsig(c_es_nore, self.c50_nore_map, self.gamma_nore_map)
         u_propo = ((c_es_propo[0]/self.c50_propo_map_1)**self.gamma_propo_map_1 +
                    (c_es_propo[1]/self.c50_propo_map_2)**self.gamma_propo_map_2)
-        map_propo = - (self.emax_propo_DAP + (self.emax_propo_SAP + self.emax_propo_DAP) / 3) * u_propo/(1+u_propo)
+        map_propo = self._propo_map_coef * u_propo/(1+u_propo)
         map_remi = self.emax_remi_map * fsig(c_es_remi, self.c50_remi_map, self.gamma_remi_map)
 
         self.map = self.map_base + map_nore + map_propo + map_remi
@@ -804,6 +983,26 @@ class Hemo_simple_PD_model():
         return self.map, self.co
 
 
+def _mvn_factor(cov: list) -> np.ndarray:
+    """Return the matrix A such that z @ A follows N(0, cov) for z standard normal.
+
+    The factor is the one used by np.random.multivariate_normal, so that the draws are the same for a given seed.
+    """
+    _, s, v = np.linalg.svd(cov)
+    return np.sqrt(s)[:, None] * v
+
+
+# covariance of the intercorrelated uncertainties of the Su model, see Hemo_meca_PD_model.__init__
+_SU_BLOCK1_COV = [
+    [0.0328, -0.0244, 0],
+    [-0.0244, 0.0528, -0.0233],
+    [0, -0.0233, 0.0242]
+]
+_SU_BLOCK2_COV = [[0.00382, 0.00329], [0.00329, 0.00868]]
+_SU_BLOCK1_FACTOR = _mvn_factor(_SU_BLOCK1_COV)
+_SU_BLOCK2_FACTOR = _mvn_factor(_SU_BLOCK2_COV)
+
+
 class Hemo_meca_PD_model:
     r"""This class implements the mechanically based model of Haemodynamics proposed in [Su2023].
 
@@ -938,14 +1137,10 @@ class Hemo_meca_PD_model:
 
             # uncertainties values
             self.w_block1_mu = [0, 0, 0]
-            self.w_block1_cov = [
-                [0.0328, -0.0244, 0],
-                [-0.0244, 0.0528, -0.0233],
-                [0, -0.0233, 0.0242]
-            ]
+            self.w_block1_cov = _SU_BLOCK1_COV
 
             self.w_block2_mu = [0, 0]
-            self.w_block2_cov = [[0.00382, 0.00329], [0.00329, 0.00868]]
+            self.w_block2_cov = _SU_BLOCK2_COV
 
             self.w_c50_propo_tpr = np.sqrt(0.44)
             self.w_emax_remi_tpr = np.sqrt(0.449)
@@ -975,22 +1170,27 @@ class Hemo_meca_PD_model:
 
         if random:
             # compute intercorrelated uncertainties
-            eta_values_block1 = np.random.multivariate_normal(self.w_block1_mu, self.w_block1_cov, size=1)[0]
-            eta_values_block2 = np.random.multivariate_normal(self.w_block2_mu, self.w_block2_cov, size=1)[0]
+            eta_values_block1 = np.random.standard_normal((1, 3)) @ _SU_BLOCK1_FACTOR
+            eta_values_block2 = np.random.standard_normal((1, 2)) @ _SU_BLOCK2_FACTOR
+            eta_values_block1, eta_values_block2 = eta_values_block1[0], eta_values_block2[0]
+
+            # independent uncertainties, one call for all the draws in the same order as one call per parameter
+            eta_values = np.random.normal(0, scale=[self.w_c50_propo_tpr, self.w_emax_remi_tpr,
+                                                    w_emax_nore_map, w_c50_nore_map, w_gamma_nore_map])
 
             # lognormal distribution
             self.tpr_base *= np.exp(eta_values_block1[0])
             self.sv_base *= np.exp(eta_values_block1[1])
             self.hr_base *= np.exp(eta_values_block1[2])
-            self.c50_propo_tpr *= np.exp(np.random.normal(0, self.w_c50_propo_tpr))
+            self.c50_propo_tpr *= np.exp(eta_values[0])
             # normal distribution
-            self.emax_remi_tpr += np.random.normal(0, self.w_emax_remi_tpr)
+            self.emax_remi_tpr += eta_values[1]
             self.sl_remi_hr += eta_values_block2[0]
             self.sl_remi_sv += eta_values_block2[1]
 
-            self.emax_nore_map *= np.exp(np.random.normal(0, scale=w_emax_nore_map))
-            self.c50_nore_map *= np.exp(np.random.normal(0, scale=w_c50_nore_map))
-            self.gamma_nore_map *= np.exp(np.random.normal(0, scale=w_gamma_nore_map))
+            self.emax_nore_map *= np.exp(eta_values[2])
+            self.c50_nore_map *= np.exp(eta_values[3])
+            self.gamma_nore_map *= np.exp(eta_values[4])
 
         self.x = np.array([
             self.tpr_base,
@@ -1014,22 +1214,12 @@ class Hemo_meca_PD_model:
         self.abase_hr = self.hr_base * (1 + self.ltde_hr)
         self.base_map = self.tpr_base * self.abase_sv * self.abase_hr
 
-        def continuous_dynamic_sys(t, x, u, params=None):
-            return self.continuous_dynamic(x, u)
-
-        def output_function_sys(t, x, u, params=None):
-            return self.output_function(x)
-
-        self.hemo_system = control.NonlinearIOSystem(
-            continuous_dynamic_sys,
-            output_function_sys,
-            inputs=4,
-            outputs=5,
-            states=5,
-        )
+        # number of Runge Kutta 4 sub-steps per sampling time, each sub-step lasts at most 1s
+        self.rk4_substeps = max(4, math.ceil(ts))
 
         self.previous_cp_propo = 0
         self.previous_cp_remi = 0
+        self._F_root = None  # equilibrium rootfinder, see _equilibrium_rootfinder
 
     def continuous_dynamic(
             self,
@@ -1059,12 +1249,16 @@ class Hemo_meca_PD_model:
         map_wanted = u[2]
         sv_wanted = u[3]
 
-        eff_propo_tpr = (self.emax_propo_tpr + self.int_tpr * fsig(cp_remi, self.c50_remi_tpr, 1)) * \
+        # sigmoids shared by several effects
+        sig_remi_tpr = fsig1(cp_remi, self.c50_remi_tpr)
+        sig_propo_sv = fsig1(cp_propo, self.c50_propo_sv)
+
+        eff_propo_tpr = (self.emax_propo_tpr + self.int_tpr * sig_remi_tpr) * \
             fsig(cp_propo, self.c50_propo_tpr, self.gamma_propo_tpr)
-        eff_remi_sv = (self.sl_remi_sv + self.int_sv * fsig(cp_propo, self.c50_propo_sv, 1)) * cp_remi
-        eff_remi_hr = (self.sl_remi_hr + self.int_hr * fsig(cp_propo, self.c50_int_hr, 1)) * cp_remi
-        eff_propo_sv = self.emax_propo_sv * fsig(cp_propo, self.c50_propo_sv, 1)
-        eff_remi_tpr = self.emax_remi_tpr * fsig(cp_remi, self.c50_remi_tpr, 1)
+        eff_remi_sv = (self.sl_remi_sv + self.int_sv * sig_propo_sv) * cp_remi
+        eff_remi_hr = (self.sl_remi_hr + self.int_hr * fsig1(cp_propo, self.c50_int_hr)) * cp_remi
+        eff_propo_sv = self.emax_propo_sv * sig_propo_sv
+        eff_remi_tpr = self.emax_remi_tpr * sig_remi_tpr
 
         # compute apparent values
         dsv = x[1] + x[3]
@@ -1074,24 +1268,23 @@ class Hemo_meca_PD_model:
         a_map = a_sv * dhr * x[0]
 
         rmap = a_map/self.base_map
+        rmap_fb = rmap**self.fb  # feedback of MAP, common to the three dynamics
 
         sv = x[1]
         hr = x[2]
-        tpr_dot = self.k_in_tpr * rmap**self.fb * (1 + eff_propo_tpr) - \
+        # The optional terms are switched on by multiplying them with their condition, so that the dynamic can
+        # also be evaluated element-wise on arrays of patients (see Hemo_meca_PD_ensemble).
+        tpr_dot = self.k_in_tpr * rmap_fb * (1 + eff_propo_tpr) - \
             self.k_out*x[0]*(1 - eff_remi_tpr)
-        if map_wanted > 0:
-            tpr_dot += (map_wanted - a_map) * self.k_effect
-        sv_dot_star = self.k_in_sv * rmap**self.fb * (1 + eff_propo_sv) - self.k_out*sv*(1 - eff_remi_sv)
-        if sv_wanted > 0:
-            sv_dot_star += (sv_wanted - a_sv) * self.k_effect*10000
-        hr_dot_star = self.k_in_hr * rmap**self.fb - self.k_out*hr*(1 - eff_remi_hr)
-
-        if u[0] > 0:  # apply the time dependant function only if anesthesia as started.
-            ltde_sv_dot = -self.k_ltde * x[3]
-            ltde_hr_dot = -self.k_ltde * x[4]
-        else:
-            ltde_sv_dot = 0
-            ltde_hr_dot = 0
+        tpr_dot += (map_wanted - a_map) * self.k_effect * (map_wanted > 0)
+        sv_dot_star = self.k_in_sv * rmap_fb * (1 + eff_propo_sv) - self.k_out*sv*(1 - eff_remi_sv)
+        sv_dot_star += (sv_wanted - a_sv) * self.k_effect*10000 * (sv_wanted > 0)
+        hr_dot_star = self.k_in_hr * rmap_fb - self.k_out*hr*(1 - eff_remi_hr)
+
+        # apply the time dependant function only if anesthesia as started.
+        anesthesia_started = cp_propo > 0
+        ltde_sv_dot = -self.k_ltde * x[3] * anesthesia_started
+        ltde_hr_dot = -self.k_ltde * x[4] * anesthesia_started
 
         return np.array([tpr_dot, sv_dot_star, hr_dot_star, ltde_sv_dot, ltde_hr_dot])
 
@@ -1118,6 +1311,44 @@ class Hemo_meca_PD_model:
         co = hr * sv / 1000  # fro mL/min to L/min
         return np.array([tpr, sv, hr, map, co])
 
+    def _rk4_step(
+            self,
+            x: np.ndarray,
+            u_prev: np.ndarray,
+            u_next: np.ndarray,
+    ) -> np.ndarray:
+        """Integrate the continuous dynamic over one sampling time with the classical Runge Kutta 4 method.
+
+        The input is linearly interpolated between its values at the beginning and at the end of the sampling time.
+
+        Parameters
+        ----------
+        x : np.ndarray
+            state at the beginning of the sampling time.
+        u_prev : np.ndarray
+            input at the beginning of the sampling time, u = [cp_propo, cp_remi, map_wanted, sv_wanted].
+        u_next : np.ndarray
+            input at the end of the sampling time.
+
+        Returns
+        -------
+        np.ndarray
+            state at the end of the sampling time.
+        """
+        h = self.ts / self.rk4_substeps
+        du = (u_next - u_prev) / self.rk4_substeps
+        u_start = u_prev
+        for _ in range(self.rk4_substeps):
+            u_mid = u_start + du/2
+            u_end = u_start + du
+            k1 = self.continuous_dynamic(x, u_start)
+            k2 = self.continuous_dynamic(x + h/2*k1, u_mid)
+            k3 = self.continuous_dynamic(x + h/2*k2, u_mid)
+            k4 = self.continuous_dynamic(x + h*k3, u_end)
+            x = x + h/6*(k1 + 2*k2 + 2*k3 + k4)
+            u_start = u_end
+        return x
+
     def nore_map_effect(self, cp_nore: float):
         """Compute Norepinephrine effect on MAP.
 
@@ -1138,7 +1369,7 @@ class Hemo_meca_PD_model:
     ) -> np.ndarray:
         """Compute one step time of the hemodynamic system.
 
-        It use Runge Kutta 4 to compute the non-linear integration.
+        It use Runge Kutta 4 to compute the non-linear integration, with sub-steps of at most 1s.
 
         Parameters
         ----------
@@ -1152,63 +1383,35 @@ class Hemo_meca_PD_model:
             blood volume as a fraction of init volume, 1 mean no loss, 0 mean 100% loss, default is 1.
         """
         # run computation for model without nore effect and without blood loss
-        results = control.input_output_response(
-            self.hemo_system,
-            T=np.array([0, self.ts]),
-            U=np.array(
-                [[self.previous_cp_propo, cp_propo],
-                 [self.previous_cp_remi, cp_remi],
-                 [0, 0],
-                 [0, 0]]
-            ),
-            X0=self.x,
-            return_x=True,
-        )
-        self.x = results.x[:, 1]
-
-        if (self.flag_nore_used or cp_nore > 0) and not self.flag_blood_loss:
+        # one column of inputs per patient for Hemo_meca_PD_ensemble
+        u_prev = np.zeros((4,) + np.shape(self.x[0]))
+        u_next = np.zeros((4,) + np.shape(self.x[0]))
+        u_prev[0], u_prev[1] = self.previous_cp_propo, self.previous_cp_remi
+        u_next[0], u_next[1] = cp_propo, cp_remi
+        self.x = self._rk4_step(self.x, u_prev, u_next)
+
+        if (self.flag_nore_used or np.any(cp_nore > 0)) and not self.flag_blood_loss:
             if not self.flag_blood_loss:
                 self.flag_nore_used = True
-            if v_ratio != 1:
+            if np.any(v_ratio != 1):
                 print("Warning: norepinephrine effect is not computed with blood loss")
-            map_no_nore = results.y[3, 1]
+            map_no_nore = self.output_function(self.x)[3]
             map_wanted = map_no_nore + self.nore_map_effect(cp_nore)
             # run computation for model with nore effect
-            results_w_nore = control.input_output_response(
-                self.hemo_system,
-                T=np.array([0, self.ts]),
-                U=np.array(
-                    [[self.previous_cp_propo, cp_propo],
-                     [self.previous_cp_remi, cp_remi],
-                     [map_wanted, map_wanted],
-                     [0, 0]]
-                ),
-                X0=self.x_effect,
-                return_x=True,
-            )
-            self.x_effect = results_w_nore.x[:, 1]
-        elif (v_ratio < 1 or self.flag_blood_loss) and not self.flag_nore_used:
+            u_prev[2] = u_next[2] = map_wanted
+            self.x_effect = self._rk4_step(self.x_effect, u_prev, u_next)
+        elif (np.any(v_ratio < 1) or self.flag_blood_loss) and not self.flag_nore_used:
             if not self.flag_blood_loss:
                 self.flag_blood_loss = True
-            if cp_nore > 0:
+            if np.any(cp_nore > 0):
                 print("Warning: norepinephrine effect is not computed with blood loss")
-            sv_no_blood_loss = results.y[1, 1]
+            sv_no_blood_loss = self.output_function(self.x)[1]
             sv_wanted = sv_no_blood_loss*v_ratio
-            results_blood_loss = control.input_output_response(
-                self.hemo_system,
-                T=np.array([0, self.ts]),
-                U=np.array(
-                    [[self.previous_cp_propo, cp_propo],
-                     [self.previous_cp_remi, cp_remi],
-                     [0, 0],
-                     [sv_wanted, sv_wanted]]
-                ),
-                X0=self.x_effect,
-                return_x=True,
-            )
-            self.x_effect = results_blood_loss.x[:, 1]
+            u_prev[3] = u_next[3] = sv_wanted
+            self.x_effect = self._rk4_step(self.x_effect, u_prev, u_next)
         else:
-            self.x_effect = self.x.copy()
+            # _rk4_step returns a new array and never modifies its input, so both states can share it
+            self.x_effect = self.x
 
         self.previous_cp_propo = cp_propo
         self.previous_cp_remi = cp_remi
@@ -1245,18 +1448,32 @@ class Hemo_meca_PD_model:
             self.x = x0
             self.x_no_nore = x0
 
-        y_output = np.zeros((len(cp_propo), 5))
+        y_output = np.zeros((len(cp_propo), 5) + np.shape(self.x[0]))
         for index in range(len(cp_propo)):
-            y_output[index, :] = self.one_step(cp_propo[index], cp_remi[index], cp_nore[index])
+            y_output[index] = self.one_step(cp_propo[index], cp_remi[index], cp_nore[index])
 
         return y_output
 
+    def _equilibrium_rootfinder(self):
+        """Return the Newton rootfinder of the continuous dynamic, built on the first call and then reused.
+
+        The rootfinder takes as parameter p = [cp_propo, cp_remi, map_wanted]. The model parameters are frozen
+        in the rootfinder when it is built.
+        """
+        if self._F_root is None:
+            x = cas.MX.sym('x', 5)
+            p = cas.MX.sym('p', 3)
+            dx = cas.vertcat(*self.continuous_dynamic(x, [p[0], p[1], p[2], 0]))
+            self._F_root = cas.rootfinder('F_root', 'newton', {'x': x, 'p': p, 'g': dx})
+        return self._F_root
+
     def state_at_equilibrium(
             self,
             cp_propo_eq: float = 0,
             cp_remi_eq: float = 0,
             cp_nore_eq: float = 0,
             x0: np.ndarray = None,
+            x_no_nore: np.ndarray = None,
     ) -> np.ndarray:
         """Solve the problem f(x,u)=0 for the continuous dynamique with a given u.
 
@@ -1270,6 +1487,9 @@ class Hemo_meca_PD_model:
             plasma concentration of norepinephrine  at equilibrium (ng/ml).
         x0 : np.ndarray, optional
             Initial state. The default is None.
+        x_no_nore : np.ndarray, optional
+            Equilibrium state without norepinephrine for the same propofol and remifentanil concentrations,
+            if it is already known (x_eq of a previous call). The default is None, it is then solved.
 
         Returns
         -------
@@ -1280,12 +1500,12 @@ class Hemo_meca_PD_model:
         if x0 is None:
             x0 = self.x
 
+        F_root = self._equilibrium_rootfinder()
+
         # solve equilibrium without nore
-        x = cas.MX.sym('x', 5)
-        dx = cas.vertcat(*self.continuous_dynamic(x, [cp_propo_eq, cp_remi_eq, 0, 0]))
-        F_root = cas.rootfinder('F_root', 'newton', {'x': x, 'g': dx})
-        sol = F_root(x0=x0)
-        x_no_nore = sol['x'].full().flatten()
+        if x_no_nore is None:
+            sol = F_root(x0=x0, p=[cp_propo_eq, cp_remi_eq, 0])
+            x_no_nore = sol['x'].full().flatten()
         self.x_eq = x_no_nore
 
         # if nore is used, solve equilibrium with nore
@@ -1293,12 +1513,7 @@ class Hemo_meca_PD_model:
             output_no_nore = self.output_function(x_no_nore)
             map_eq = output_no_nore[3] + self.nore_map_effect(cp_nore_eq)
             # solve equilibrium with nore
-            x = cas.MX.sym('x', 5)
-            dx = cas.vertcat(*self.continuous_dynamic(x, [cp_propo_eq, cp_remi_eq, map_eq, 0]))
-            # map_nore = self.output_function(x)[3]
-            # dx[0] = (map_nore - map_eq)**2
-            F_root = cas.rootfinder('F_root', 'newton', {'x': x, 'g': dx})
-            sol = F_root(x0=x0)
+            sol = F_root(x0=x0, p=[cp_propo_eq, cp_remi_eq, map_eq])
 
             x_eq_out = sol['x'].full().flatten()
         else:
@@ -1339,3 +1554,149 @@ class Hemo_meca_PD_model:
         self.x = self.x_eq
         self.previous_cp_propo = cp_propo_eq
         self.previous_cp_remi = cp_remi_eq
+
+
+class Hemo_meca_PD_ensemble:
+    r"""Struct-of-arrays version of Hemo_meca_PD_model for a population of n virtual patients.
+
+    Each parameter is stored as an array of shape (n,) and the states as arrays of shape (5, n), so that the
+    dynamic of the whole population is integrated in a single vectorized call. The equations are the ones of
+    :class:`Hemo_meca_PD_model`.
+
+    Parameters
+    ----------
+    n : int
+        Number of patients in the population.
+    age : float
+        Age of the patients in years.
+    ts : float
+        Sampling time in seconds.
+    model : str, optional
+        Model to use, only 'Su' is available. The default is 'Su'.
+    nore_model : str, optional
+        Model to use for norepinephrine, 'Beloeil' and 'Oualha' are available. The default is 'Beloeil'.
+    random : bool, optional
+        Add uncertainties in the parameters. With the same seed, the patients are the ones obtained by creating
+        n Hemo_meca_PD_model(random=True) one after the other. The default is True.
+    hr_base : float, optional
+        Baseline heart rate (bpm). The default is None, which will use the value from the Su model.
+    sv_base : float, optional
+        Baseline stroke volume (mL). The default is None, which will use the value from the Su model.
+    map_base : float, optional
+        Baseline mean arterial pressure (mmHg). The default is None, which will use the value from the Su model.
+
+    Notes
+    -----
+    The concentrations given to one_step and full_sim can be either scalars, shared by all the patients, or arrays
+    of shape (n,). The norepinephrine and blood loss effects are switched on for the whole population as soon as one
+    patient needs them.
+    """
+
+    # attributes common to all the patients
+    _SHARED = ('ts', 'rk4_substeps', 'flag_nore_used', 'flag_blood_loss', 'previous_cp_propo', 'previous_cp_remi')
+
+    def __init__(self,
+                 n: int,
+                 age: float,
+                 ts: float,
+                 model: str = 'Su',
+                 nore_model: str = 'Beloeil',
+                 random: bool = True,
+                 hr_base: float = None,
+                 sv_base: float = None,
+                 map_base: float = None,
+                 ):
+        """
+        Initialize the class.
+
+        Returns
+        -------
+        None.
+
+        """
+        patients = [Hemo_meca_PD_model(age, ts, model=model, nore_model=nore_model, random=random,
+                                       hr_base=hr_base, sv_base=sv_base, map_base=map_base)
+                    for _ in range(n)]
+        self.n = n
+        self._param_names = []
+        for name, value in vars(patients[0]).items():
+            if name in ('x', 'x_effect'):
+                value = np.stack([getattr(patient, name) for patient in patients], axis=1)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool) and name not in self._SHARED:
+                value = np.array([getattr(patient, name) for patient in patients])
+                self._param_names.append(name)
+            setattr(self, name, value)
+
+    # the Hemo_meca_PD_model equations broadcast over the parameter and state arrays
+    continuous_dynamic = Hemo_meca_PD_model.continuous_dynamic
+    output_function = Hemo_meca_PD_model.output_function
+    nore_map_effect = Hemo_meca_PD_model.nore_map_effect
+    _rk4_step = Hemo_meca_PD_model._rk4_step
+    one_step = Hemo_meca_PD_model.one_step
+    full_sim = Hemo_meca_PD_model.full_sim
+    initialized_at_given_concentration = Hemo_meca_PD_model.initialized_at_given_concentration
+
+    def _equilibrium_rootfinder(self) -> cas.Function:
+        """Return the rootfinder of the continuous dynamic mapped over the population, built at the first call.
+
+        The patient parameters are symbolic in the rootfinder, so that a single function solves the equilibrium of
+        all the patients. It takes as parameter an array of shape (3 + number of parameters, n), each column being
+        [cp_propo, cp_remi, map_wanted, parameters of the patient].
+        """
+        if self._F_root is None:
+            x = cas.MX.sym('x', 5)
+            p = cas.MX.sym('p', 3 + len(self._param_names))
+            symbolic_patient = SimpleNamespace(**{name: p[3 + i] for i, name in enumerate(self._param_names)})
+            dx = cas.vertcat(*Hemo_meca_PD_model.continuous_dynamic(symbolic_patient, x, [p[0], p[1], p[2], 0]))
+            F_root = cas.rootfinder('F_root', 'newton', {'x': x, 'p': p, 'g': dx})
+            self._F_root = F_root.map(self.n)
+        return self._F_root
+
+    def state_at_equilibrium(
+            self,
+            cp_propo_eq: float = 0,
+            cp_remi_eq: float = 0,
+            cp_nore_eq: float = 0,
+            x0: np.ndarray = None,
+    ) -> np.ndarray:
+        """Solve the problem f(x,u)=0 for the continuous dynamique of all the patients in one call.
+
+        Parameters
+        ----------
+        c_propo : float or np.ndarray
+            plasma concentration of propofol at equilibrium (µg/ml).
+        cp_remi : float or np.ndarray
+            plasma concentration of remifentanil  at equilibrium (ng/ml).
+        cp_nore : float or np.ndarray
+            plasma concentration of norepinephrine  at equilibrium (ng/ml).
+        x0 : np.ndarray, optional
+            Initial state of shape (5, n). The default is None.
+
+        Returns
+        -------
+        np.ndarray
+            Output values at equilibrium, of shape (5, n). The columns of the patients for which the
+            newton solver does not converge are NaN, check them with np.isfinite.
+        """
+
+        if x0 is None:
+            x0 = self.x
+
+        F_root = self._equilibrium_rootfinder()
+        p = np.zeros((3 + len(self._param_names), self.n))
+        p[0], p[1] = cp_propo_eq, cp_remi_eq
+        for i, name in enumerate(self._param_names):
+            p[3 + i] = getattr(self, name)
+
+        # solve equilibrium without nore
+        self.x_eq = F_root(x0=x0, p=p)['x'].full()
+
+        # if nore is used, solve equilibrium with nore
+        if np.any(cp_nore_eq > 0):
+            p[2] = self.output_function(self.x_eq)[3] + self.nore_map_effect(cp_nore_eq)
+            p[2] *= np.asarray(cp_nore_eq) > 0
+            self.x_eq_w_nore = F_root(x0=x0, p=p)['x'].full()
+        else:
+            self.x_eq_w_nore = self.x_eq
+
+        return self.output_function(self.x_eq_w_nore)
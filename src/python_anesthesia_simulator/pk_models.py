@@ -68,6 +68,8 @@ class CompartmentModel:
         Continuous state space model.
     discrete_sys : control.StateSpace
         Discrete state space model.
+    dcgain : float
+        Static gain of the continuous model.
     x : np.ndarray
         State vector.
     y : np.ndarray
@@ -599,9 +601,7 @@ class CompartmentModel:
         self.v1 = v1
         self.drug = drug
         # Continuous system with blood concentration as output
-        self.continuous_sys = control.ss(A, B, C, D)
-        # Discretization of the system
-        self.discretize_sys = self.continuous_sys.sample(self.ts)
+        self._set_system(A, B, C, D)
 
         # init output
         if x0 is None:
@@ -611,7 +611,34 @@ class CompartmentModel:
         self.x = x0
         self.y = np.dot(C, self.x)
 
+        # ring buffer of the last inputs to apply the lag, _u_index is the position of the next input
         self.u_buffer = np.zeros(int(np.round(self.u_lag / self.ts))+1)
+        self._u_index = 0
+
+    def _set_system(self, A: np.ndarray, B: np.ndarray, C: np.ndarray, D: np.ndarray):
+        """Set the continuous system and its discretization, and reset the cached static gains."""
+        self.continuous_sys = control.ss(A, B, C, D)
+        # Discretization of the system
+        a = self.continuous_sys.A
+        if a.shape == (1, 1) and a[0, 0] != 0:
+            # closed-form zero-order hold for the one-compartment models, avoids the matrix exponential
+            ad = np.exp(a[0, 0] * self.ts)
+            self.discretize_sys = control.ss([[ad]], (ad - 1) / a[0, 0] * self.continuous_sys.B,
+                                             self.continuous_sys.C, self.continuous_sys.D, self.ts)
+        else:
+            self.discretize_sys = self.continuous_sys.sample(self.ts)
+        # plain arrays of the discrete system for one_step, with B and D as vectors of the single input
+        self._Ad, self._Cd = self.discretize_sys.A, self.discretize_sys.C
+        self._Bd, self._Dd = self.discretize_sys.B[:, 0], self.discretize_sys.D[:, 0]
+        self._dcgain = None
+        self._discrete_dcgain = None
+
+    @property
+    def dcgain(self) -> float:
+        """Static gain of the continuous system, computed once for each set of parameters."""
+        if self._dcgain is None:
+            self._dcgain = control.dcgain(self.continuous_sys)
+        return self._dcgain
 
     def one_step(self, u: float) -> list:
         """Simulate one step of PK model.
@@ -631,13 +658,17 @@ class CompartmentModel:
             for Remifentanil and Norepinephrine).
 
         """
-        self.u_buffer = np.roll(self.u_buffer, -1)
-        self.u_buffer[-1] = u
-        self.x = self.discretize_sys.dynamics(None, self.x, u=self.u_buffer[0]+self.u_endo)
-        self.y = self.discretize_sys.output(None, self.x, u=self.u_buffer[0]+self.u_endo)
+        self.u_buffer[self._u_index] = u
+        self._u_index = (self._u_index + 1) % len(self.u_buffer)
+        u_delayed = self.u_buffer[self._u_index]  # oldest input of the buffer
+        u_applied = u_delayed + self.u_endo
+        self.x = self._Ad @ self.x + self._Bd * u_applied
+        self.y = self._Cd @ self.x + self._Dd * u_applied
         if self.drug == 'Norepinephrine':
-            self.target = control.dcgain(self.discretize_sys)*(self.u_buffer[0]+self.u_endo)
-            self.input = self.u_buffer[0] + self.u_endo
+            if self._discrete_dcgain is None:
+                self._discrete_dcgain = control.dcgain(self.discretize_sys)
+            self.target = self._discrete_dcgain*(u_delayed+self.u_endo)
+            self.input = u_delayed + self.u_endo
         return self.y
 
     def full_sim(self, u: np.ndarray, x0: Optional[np.ndarray] = None) -> list:
@@ -699,9 +730,7 @@ class CompartmentModel:
         else:
             Anew = Anew * coeff * CO_ratio
         # Continuous system with blood concentration as output
-        self.continuous_sys = control.ss(Anew, self.continuous_sys.B, self.continuous_sys.C, self.continuous_sys.D)
-        # Discretization of the system
-        self.discretize_sys = self.continuous_sys.sample(self.ts)
+        self._set_system(Anew, self.continuous_sys.B, self.continuous_sys.C, self.continuous_sys.D)
 
     def update_param_blood_loss(self, v_ratio: float, CO_ratio: float):
         """Update PK coefficient to mimic a blood loss.
@@ -734,9 +763,7 @@ class CompartmentModel:
         Bnew /= v_ratio
 
         # Continuous system with blood concentration as output
-        self.continuous_sys = control.ss(Anew, Bnew, self.continuous_sys.C, self.continuous_sys.D)
-        # Discretization of the system
-        self.discretize_sys = self.continuous_sys.sample(self.ts)
+        self._set_system(Anew, Bnew, self.continuous_sys.C, self.continuous_sys.D)
 
     def update_Li_model_propo(self, c_prop: float):
         """Update Norpineprhine Li PK model thanks to the concentration of propofol.
@@ -762,6 +789,4 @@ class CompartmentModel:
         Anew[0, 0] = -(cl1_prop/self.v1 + self._k12)/60
 
         # Continuous system with blood concentration as output
-        self.continuous_sys = control.ss(Anew, self.continuous_sys.B, self.continuous_sys.C, self.continuous_sys.D)
-        # Discretization of the system
-        self.discretize_sys = self.continuous_sys.sample(self.ts)
+        self._set_system(Anew, self.continuous_sys.B, self.continuous_sys.C, self.continuous_sys.D)
@@ -1,15 +1,35 @@
 # Standard import
+from functools import lru_cache
 from typing import Optional
 # Third party imports
 import numpy as np
 import control
 import pandas as pd
 import casadi as cas
+from scipy import optimize, signal
 # Local imports
 from .pk_models import CompartmentModel
 from .pd_models import BIS_model, TOL_model, Hemo_simple_PD_model, Hemo_meca_PD_model
 
 
+@lru_cache(maxsize=32)
+def _bis_noise_filter(ts: float) -> tuple[control.TransferFunction, np.ndarray, np.ndarray]:
+    """Return the discrete filter of the BIS noise and its coefficients (b, a) in powers of z^-1 for lfilter.
+
+    The filter only depends on the sampling time, so that it is discretized once for all the patients.
+    """
+    xi = 0.2
+    target_peak_fr = 0.03*2*np.pi
+    omega = target_peak_fr/np.sqrt(1-2*xi**2)
+    noise_filter = control.tf([0.1, 1], [1/omega**2, 2*xi/omega, 1])
+    noise_filter_d = control.sample_system(noise_filter, ts)
+    # the numerator is delayed to the denominator order
+    num, den = control.tfdata(noise_filter_d)
+    a = np.ravel(den)
+    b = np.concatenate((np.zeros(len(a) - np.size(num)), np.ravel(num)))
+    return noise_filter_d, b, a
+
+
 class Patient:
     r"""Define a Patient class able to simulate Anesthesia process.
 
@@ -199,15 +219,16 @@ class Patient:
         self.bis_noise_std = 3
         self.co_noise_std = 0.1
         self.map_noise_std = 5
-        xi = 0.2
-        target_peak_fr = 0.03*2*np.pi
-        omega = target_peak_fr/np.sqrt(1-2*xi**2)
-        noise_filter = control.tf([0.1, 1], [1/omega**2, 2*xi/omega, 1])
-        self.noise_filter_d = control.sample_system(noise_filter, self.ts)
+        self.noise_filter_d, self._noise_filter_b, self._noise_filter_a = _bis_noise_filter(self.ts)
         white_noise = np.random.normal(0, self.bis_noise_std, 1000)
-        _, self.bis_noise = control.forced_response(self.noise_filter_d, U=white_noise, squeeze=True)
+        self.bis_noise, self._noise_filter_state = signal.lfilter(
+            self._noise_filter_b, self._noise_filter_a, white_noise, zi=np.zeros(len(self._noise_filter_a) - 1))
         self.noise_index = 0
 
+        # optimization solver of find_equilibrium, built at the first call
+        self._equilibrium_solver = None
+        self._equilibrium_solver_key = None
+
         # Init all the output variable
         self.bis = self.bis_pd.compute_bis(0, 0)
         self.tol = self.tol_pd.compute_tol(0, 0)
@@ -255,6 +276,10 @@ class Patient:
             Tolerance of Laryngoscopy index (0-1).
 
         """
+        # no line saved since init_dataframe (e.g. after full_sim): save the current state to hold the inputs
+        if self.save_data_bool and self._n_lines == 0:
+            self.save_data()
+
         # update PK model with CO
         if self.co_update:
             self.propo_pk.update_param_CO(self.co/(self.co_base))
@@ -297,12 +322,10 @@ class Patient:
 
         # Save data
         if self.save_data_bool:
-            index = int(self.Time/self.ts)
-            self.dataframe.loc[index, 'u_propo'] = u_propo
-            self.dataframe.loc[index, 'u_remi'] = u_remi
-            self.dataframe.loc[index, 'u_nore'] = u_nore
+            # the inputs are applied from the last saved line
+            self._data_buffer[self._n_lines - 1, 8:11] = np.hstack((u_propo, u_remi, u_nore))
             # compute time
-            self.Time += self.ts
+            self._step_idx += 1
             self.save_data()
 
         return (self.bis, self.co, self.map, self.tol)
@@ -322,13 +345,22 @@ class Patient:
             self.noise_index = 0
             # new list noise
             white_noise = np.random.normal(0, self.bis_noise_std, 1000)
-            _, self.bis_noise = control.forced_response(self.noise_filter_d, U=white_noise, squeeze=True)
+            # the filter state is kept from the previous list so that the noise stays continuous
+            self.bis_noise, self._noise_filter_state = signal.lfilter(
+                self._noise_filter_b, self._noise_filter_a, white_noise, zi=self._noise_filter_state)
         self.bis += self.bis_noise[self.noise_index]
         self.bis = np.clip(self.bis, 0, 100)
         # random noise for MAP and CO
         self.map += np.random.normal(scale=self.map_noise_std)
         self.co += np.random.normal(scale=self.co_noise_std)
 
+    def _pd_param_key(self) -> tuple:
+        """Return the parameters of the BIS and TOL models, to know when the cached solvers must be built again."""
+        return (self.bis_pd.c50p, self.bis_pd.c50r, self.bis_pd.gamma,
+                self.bis_pd.beta, self.bis_pd.E0, self.bis_pd.Emax,
+                self.tol_pd.c50p, self.tol_pd.c50r, self.tol_pd.gamma_p,
+                self.tol_pd.gamma_r, self.tol_pd.pre_intensity)
+
     def find_equilibrium(self, bis_target: float, tol_target: float,
                          map_target: float) -> tuple[float, float, float]:
         r"""
@@ -362,22 +394,30 @@ class Patient:
 
         """
         # find Remifentanil and Propofol Concentration from BIS and TOL
-        cep = cas.MX.sym('cep')  # effect site concentration of propofol in the optimization problem
-        cer = cas.MX.sym('cer')  # effect site concentration of remifentanil in the optimization problem
-
-        bis = self.bis_pd.compute_bis(cep, cer)
-        tol = self.tol_pd.compute_tol(cep, cer)
-
-        J = (bis - bis_target)**2/100**2 + (tol - tol_target)**2
-        w = [cep, cer]
-        w0 = [self.bis_pd.c50p, self.bis_pd.c50r/2.5]
         lbw = [0, 0]
         ubw = [50, 50]
+        # always start from the same point: the BIS and TOL targets can have several solutions and the
+        # one returned must not depend on the previous calls
+        w0 = [self.bis_pd.c50p, self.bis_pd.c50r/2.5]
 
-        opts = {'ipopt.print_level': 0, 'print_time': 0}
-        prob = {'f': J, 'x': cas.vertcat(*w)}
-        solver = cas.nlpsol('solver', 'ipopt', prob, opts)
-        sol = solver(x0=w0, lbx=lbw, ubx=ubw)
+        # the solver only depends on the PD models, it is built again when they change
+        solver_key = self._pd_param_key()
+        if solver_key != self._equilibrium_solver_key:
+            cep = cas.MX.sym('cep')  # effect site concentration of propofol in the optimization problem
+            cer = cas.MX.sym('cer')  # effect site concentration of remifentanil in the optimization problem
+            p = cas.MX.sym('p', 2)  # BIS and TOL targets
+
+            bis = self.bis_pd.compute_bis(cep, cer)
+            tol = self.tol_pd.compute_tol(cep, cer)
+
+            J = (bis - p[0])**2/100**2 + (tol - p[1])**2
+            w = [cep, cer]
+            opts = {'ipopt.print_level': 0, 'print_time': 0, 'ipopt.sb': 'yes'}
+
+            prob = {'f': J, 'x': cas.vertcat(*w), 'p': p}
+            self._equilibrium_solver = cas.nlpsol('solver', 'ipopt', prob, opts)
+            self._equilibrium_solver_key = solver_key
+        sol = self._equilibrium_solver(x0=w0, p=[bis_target, tol_target], lbx=lbw, ubx=ubw)
         w_opt = sol['x'].full().flatten()
         self.c_blood_propo_eq = w_opt[0]
         self.c_blood_remi_eq = w_opt[1]
@@ -397,7 +437,8 @@ class Patient:
         y_hemo = self.hemo_pd.state_at_equilibrium(
             self.c_blood_propo_eq,
             self.c_blood_remi_eq,
-            self.c_blood_nore_eq)
+            self.c_blood_nore_eq,
+            x_no_nore=self.hemo_pd.x_eq)
         self.co_eq = y_hemo[4]
         # update pharmacokinetics model from co value
         if self.co_update:
@@ -405,9 +446,9 @@ class Patient:
             self.remi_pk.update_param_CO(self.co_eq/self.co_base)
             self.nore_pk.update_param_CO(self.co_eq/self.co_base)
         # get rate input
-        self.u_propo_eq = self.c_blood_propo_eq / control.dcgain(self.propo_pk.continuous_sys)
-        self.u_remi_eq = self.c_blood_remi_eq / control.dcgain(self.remi_pk.continuous_sys)
-        self.u_nore_eq = self.c_blood_nore_eq / control.dcgain(self.nore_pk.continuous_sys)
+        self.u_propo_eq = self.c_blood_propo_eq / self.propo_pk.dcgain
+        self.u_remi_eq = self.c_blood_remi_eq / self.remi_pk.dcgain
+        self.u_nore_eq = self.c_blood_nore_eq / self.nore_pk.dcgain
         if self.co_update:
             # set it back to normal
             self.propo_pk.update_param_CO(1)
@@ -422,17 +463,16 @@ class Patient:
         Find the input of Propofol and Remifentanil to meet the BIS target at the
         equilibrium with a fixed ratio between drugs rates.
 
-        Solve the optimization problem:
-
-        .. math:: J = (bis - bis_{target})^2
-
-        Where :math:`bis` is the BIS computed from the pharmacodynamic model.
-        And with the constraints:
+        At the equilibrium the effect site concentrations are linear in the drugs rates:
 
-        .. math:: u_{propo} = u_{remi} * rp_{ratio}
+        .. math:: u_{remi} = u_{propo} * rp_{ratio}
         .. math:: A_{propo} x_{propo} + B_{propo} u_{propo} = 0
         .. math:: A_{remi} x_{remi} + B_{remi} u_{remi} = 0
 
+        The BIS is then a decreasing function of :math:`u_{propo}` only, and the equation
+        :math:`bis(u_{propo}) = bis_{target}` is solved with Brent's method. If the target can not be
+        reached, the rate is saturated to the bounds :math:`[10^{-3}, 10^4]`.
+
         Parameters
         ----------
         bis_target : float
@@ -448,47 +488,25 @@ class Patient:
             Remifentanil infusion rate (µg/s).
 
         """
-        # solve the optimization problem
-        w = []
-        w0 = []
-        lbw = []
-        ubw = []
-        J = 0
-        g = []
-        lbg = []
-        ubg = []
-
         Ap = self.propo_pk.discretize_sys.A
         Bp = self.propo_pk.discretize_sys.B
         Ar = self.remi_pk.discretize_sys.A
         Br = self.remi_pk.discretize_sys.B
 
-        x0p = np.linalg.solve(Ap-np.eye(6), - Bp * 7 / 20)
-        x0r = np.linalg.solve(Ar-np.eye(5), - Br * 7 / 10)
-        w0 += x0p[:, 0].tolist()
-        w0 += x0r[:, 0].tolist()
-
-        xp = cas.MX.sym('xp', 6, 1)
-        xr = cas.MX.sym('xr', 5, 1)
-        UP = cas.MX.sym('up', 1)
-        w = [xp, xr, UP]
-        w0 += [7 / 2]
-        lbw = [1e-3] * 12
-        ubw = [1e4] * 12
-
-        bis = self.bis_pd.compute_bis(xp[3], xr[3])
-        J = (bis_target - bis)**2
-
-        g = [(Ap-np.eye(6)) @ xp + Bp * UP, (Ar-np.eye(5)) @ xr + Br * (rp_ratio * UP)]
-        lbg = [-1e-8] * 11
-        ubg = [1e-8] * 11
-        opts = {'ipopt.print_level': 0, 'print_time': 0}
-        prob = {'f': J, 'x': cas.vertcat(*w), 'g': cas.vertcat(*g)}
-        solver = cas.nlpsol('solver', 'ipopt', prob, opts)
-        sol = solver(x0=w0, lbx=lbw, ubx=ubw, lbg=lbg, ubg=ubg)
-        w_opt = sol['x'].full().flatten()
+        # effect site concentrations at the equilibrium for a unitary propofol rate
+        ce_propo = np.linalg.solve(Ap - np.eye(6), -Bp)[3, 0]
+        ce_remi = np.linalg.solve(Ar - np.eye(5), -Br)[3, 0] * rp_ratio
 
-        self.u_propo_eq = w_opt[-1]
+        def bis_error(u_propo):
+            return float(self.bis_pd.compute_bis(ce_propo * u_propo, ce_remi * u_propo)) - bis_target
+
+        lb, ub = 1e-3, 1e4
+        if bis_error(lb) <= 0:
+            self.u_propo_eq = lb
+        elif bis_error(ub) >= 0:
+            self.u_propo_eq = ub
+        else:
+            self.u_propo_eq = optimize.brentq(bis_error, lb, ub, xtol=1e-12)
         self.u_remi_eq = rp_ratio * self.u_propo_eq
         return self.u_propo_eq, self.u_remi_eq
 
@@ -525,16 +543,16 @@ class Patient:
             self.remi_pk.update_param_CO(self.co_eq/self.co_base)
             self.nore_pk.update_param_CO(self.co_eq/self.co_base)
 
-        self.c_blood_propo_eq = u_propo * control.dcgain(self.propo_pk.continuous_sys)
-        self.c_blood_remi_eq = u_remi * control.dcgain(self.remi_pk.continuous_sys)
-        self.c_blood_nore_eq = u_nore * control.dcgain(self.nore_pk.continuous_sys)
+        self.c_blood_propo_eq = u_propo * self.propo_pk.dcgain
+        self.c_blood_remi_eq = u_remi * self.remi_pk.dcgain
+        self.c_blood_nore_eq = u_nore * self.nore_pk.dcgain
 
         # PK models
-        self.propo_pk.x = np.array([self.c_blood_propo_eq]*len(self.propo_pk.x))
+        self.propo_pk.x = np.full(len(self.propo_pk.x), self.c_blood_propo_eq)
 
-        self.remi_pk.x = np.array([self.c_blood_remi_eq]*len(self.remi_pk.x))
+        self.remi_pk.x = np.full(len(self.remi_pk.x), self.c_blood_remi_eq)
 
-        self.nore_pk.x = np.array([self.c_blood_nore_eq]*len(self.nore_pk.x))
+        self.nore_pk.x = np.full(len(self.nore_pk.x), self.c_blood_nore_eq)
 
         # PD hemo
         self.hemo_pd.initialized_at_given_concentration(
@@ -615,10 +633,12 @@ class Patient:
         self.blood_volume += fluid_rate*self.ts
 
         # Update the models
-        self.propo_pk.update_param_blood_loss(self.blood_volume/self.blood_volume_init, self.co/(self.co_base))
-        self.remi_pk.update_param_blood_loss(self.blood_volume/self.blood_volume_init, self.co/(self.co_base))
-        self.nore_pk.update_param_blood_loss(self.blood_volume/self.blood_volume_init, self.co/(self.co_base))
-        self.bis_pd.update_param_blood_loss(self.blood_volume/self.blood_volume_init)
+        v_ratio = self.blood_volume/self.blood_volume_init
+        co_ratio = self.co/self.co_base
+        self.propo_pk.update_param_blood_loss(v_ratio, co_ratio)
+        self.remi_pk.update_param_blood_loss(v_ratio, co_ratio)
+        self.nore_pk.update_param_blood_loss(v_ratio, co_ratio)
+        self.bis_pd.update_param_blood_loss(v_ratio)
 
     def init_dataframe(self):
         r"""Initilize the dataframe variable with the following columns:
@@ -638,37 +658,49 @@ class Patient:
             - 'x_nore': State of the norepinephrine PK model
             - 'blood_volume': Blood volume (L)
         """
-        self.Time = 0
+        self._step_idx = 0  # number of steps since the dataframe initialization
         column_names = ['Time',  # time
-                        'BIS', 'TOL', 'MAP', 'CO',  # outputs
+                        'BIS', 'TOL', 'TPR', 'SV', 'HR', 'MAP', 'CO',  # outputs
                         'u_propo', 'u_remi', 'u_nore',  # inputs
                         'blood_volume']  # nore concentration and blood volume
         propo_state_names = [f'x_propo_{i+1}' for i in range(len(self.propo_pk.x))]
         remi_state_names = [f'x_remi_{i+1}' for i in range(len(self.remi_pk.x))]
         nore_state_names = [f'x_nore_{i+1}' for i in range(len(self.nore_pk.x))]
         column_names += propo_state_names + remi_state_names + nore_state_names
-        self.dataframe = pd.DataFrame(columns=column_names, dtype=float)
+        # the lines are stored in a numpy buffer, grown by doubling, and converted to a dataframe on demand
+        self._column_names = column_names
+        self._data_buffer = np.empty((256, len(column_names)))
+        self._n_lines = 0
+        self._dataframe = None
 
     def save_data(self, inputs: list = [0, 0, 0]):
         r"""Save all current internal variables as a new line in self.dataframe."""
-        # store data
-
-        new_line = {'Time': self.Time,
-                    'BIS': self.bis, 'TOL': self.tol, 'TPR': self.tpr,
-                    'SV': self.sv, 'HR': self.hr, 'MAP': self.map, 'CO': self.co,  # outputs
-                    'u_propo': inputs[0], 'u_remi': inputs[1], 'u_nore': inputs[2],  # inputs
-                    'blood_volume': self.blood_volume}  # blood volume
-
-        line_x_propo = {f'x_propo_{i+1}': self.propo_pk.x[i] for i in range(len(self.propo_pk.x))}
-        line_x_remi = {f'x_remi_{i+1}': self.remi_pk.x[i] for i in range(len(self.remi_pk.x))}
-        line_x_nore = {f'x_nore_{i+1}': self.nore_pk.x[i] for i in range(len(self.nore_pk.x))}
-        new_line.update(line_x_propo)
-        new_line.update(line_x_remi)
-        new_line.update(line_x_nore)
-        self.dataframe = pd.concat(
-            [df for df in (self.dataframe, pd.DataFrame(new_line, index=[1], dtype=float)) if not df.empty],
-            ignore_index=True
-        )
+        if self._n_lines == len(self._data_buffer):
+            self._data_buffer = np.concatenate((self._data_buffer, np.empty_like(self._data_buffer)))
+        # hstack also accepts the inputs and outputs given as arrays of size 1
+        self._data_buffer[self._n_lines] = np.hstack((
+            self.Time,
+            self.bis, self.tol, self.tpr, self.sv, self.hr, self.map, self.co,  # outputs
+            inputs[0], inputs[1], inputs[2],  # inputs
+            self.blood_volume,  # blood volume
+            self.propo_pk.x, self.remi_pk.x, self.nore_pk.x))
+        self._n_lines += 1
+        self._dataframe = None
+
+    @property
+    def Time(self) -> float:
+        """Simulation time (s) since the dataframe initialization, counted in steps to avoid rounding drift."""
+        return self._step_idx * self.ts
+
+    @property
+    def dataframe(self) -> pd.DataFrame:
+        """Dataframe of the saved data, one line per sampling time, built from the buffer when it is read.
+
+        The dataframe is cached until the next saved line, modifications made on it are lost afterwards.
+        """
+        if self._dataframe is None:
+            self._dataframe = pd.DataFrame(self._data_buffer[:self._n_lines].copy(), columns=self._column_names)
+        return self._dataframe
 
     def full_sim(self, u_propo: Optional[np.ndarray] = None, u_remi: Optional[np.ndarray] = None, u_nore: Optional[np.ndarray] = None,
                  x0_propo: Optional[np.array] = None, x0_remi: Optional[np.array] = None, x0_nore: Optional[np.array] = None) -> pd.DataFrame:
@@ -702,24 +734,17 @@ class Patient:
             Dataframe with all the data.
 
         """
-        if u_propo is None and u_remi is None and u_nore is None:
+        given_inputs = [u for u in (u_propo, u_remi, u_nore) if u is not None]
+        if not given_inputs:
             raise ValueError('No input given')
+        n_steps = len(given_inputs[0])
         if u_propo is None:
-            if u_remi is None:
-                u_propo = np.zeros_like(u_nore)
-            else:
-                u_propo = np.zeros_like(u_remi)
+            u_propo = np.zeros(n_steps)
         if u_remi is None:
-            if u_propo is None:
-                u_remi = np.zeros_like(u_nore)
-            else:
-                u_remi = np.zeros_like(u_propo)
+            u_remi = np.zeros(n_steps)
         if u_nore is None:
-            if u_propo is None:
-                u_nore = np.zeros_like(u_remi)
-            else:
-                u_nore = np.zeros_like(u_propo)
-        if not (len(u_propo) == len(u_remi) and len(u_propo) == len(u_nore)):
+            u_nore = np.zeros(n_steps)
+        if not (len(u_propo) == n_steps and len(u_remi) == n_steps and len(u_nore) == n_steps):
             raise ValueError('Inputs must have the same length')
 
         # init the dataframe
@@ -743,7 +768,7 @@ class Patient:
 
         # save data
         df = pd.DataFrame({
-            'Time': np.arange(0, len(u_propo)*self.ts, self.ts),
+            'Time': np.arange(n_steps)*self.ts,
             'BIS': bis, 'TOL': tol, 'TPR': tpr, 'SV': sv,
             'HR': hr, 'MAP': map, 'CO': co,
             'u_propo': u_propo, 'u_remi': u_remi, 'u_nore': u_nore
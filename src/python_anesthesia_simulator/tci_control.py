@@ -84,6 +84,7 @@ class TCIController():
         else:
             raise ValueError('target_compartement must be either "plasma" or "effect_site"')
         self.infusion_max = maximum_rate * drug_concentration / 3600  # in mg/s or µg/s respectively Propo and Remi
+        self._rate_to_ml_per_hr = 3600 / drug_concentration  # conversion from mg/s or µg/s to ml/hr
 
         height = patient_info[1]
         weight = patient_info[2]
@@ -96,34 +97,92 @@ class TCIController():
         pk_model = CompartmentModel(patient_info, lbm, drug_name, ts=sampling_time, model=model_used)
         self.Ad = pk_model.discretize_sys.A[:4, :4]
         self.Bd = pk_model.discretize_sys.B[:4]
+        self._Bd = self.Bd[:, 0]  # input vector used with the flat state
 
-        pk_model = CompartmentModel(patient_info, lbm, drug_name, ts=control_time, model=model_used)
-        self.Ad_control = pk_model.discretize_sys.A[:4, :4]
-        self.Bd_control = pk_model.discretize_sys.B[:4]
+        # same continuous model discretized with the sampling time of the controller
+        control_sys = pk_model.continuous_sys.sample(control_time)
+        self.Ad_control = control_sys.A[:4, :4]
+        self.Bd_control = control_sys.B[:4]
+        self._Bd_control_0 = float(self.Bd_control[0, 0])
         # find the response to a 10s infusion
-        x = np.zeros((4, 1))
-        x_p = np.zeros((4, 1))
+        x = np.zeros(4)
+        x_p = np.zeros(4)
         self.Ce = []
         t = sampling_time
         self.t_peak = 0
         while self.t_peak == 0:
             if t < control_time+1:
-                x = self.Ad @ x + self.Bd * 1  # simulation of an infusion of 1 mg/s
+                x = self.Ad @ x + self._Bd * 1  # simulation of an infusion of 1 mg/s
             else:
                 x = self.Ad @ x  # simulation of no infusion
             t += sampling_time
-            self.Ce.append(float(x[self.target_id, 0]))
+            self.Ce.append(float(x[self.target_id]))
             if x[self.target_id] < x_p[self.target_id]:
                 self.t_peak = t-sampling_time
             x_p = x
         self.Ce = np.array(self.Ce)
+        self._Ce_scratch = np.empty_like(self.Ce)  # buffer of the concentration trajectories in _peak_step
+        self._Ce_0 = np.empty_like(self.Ce)  # buffer of the trajectory without infusion
+        # rows of the powers of Ad on the target compartment, the free response from x is then _pow_row @ x
+        self._pow_row = np.empty((len(self.Ce), 4))
+        power = np.eye(4)
+        for t in range(len(self.Ce)):
+            power = self.Ad @ power
+            self._pow_row[t] = power[self.target_id]
         # variable used for control
         self.infusion_rate = 0  # last control move chosen
-        self.x = np.zeros((4, 1))  # state to store the real patient
+        self._x = np.zeros(4)  # state to store the real patient
         self.target = 0
-        self.tpeak_0 = 0
-        self.tpeak_1 = 0
-        self.time = 0
+        # peak times are stored as a number of sampling steps
+        self._n_peak = len(self.Ce)
+        self._n_control = int(round(control_time/sampling_time))
+        self._peak_step_0 = 0
+        self._peak_step_1 = 0
+        self._step = 0  # number of sampling steps since the beginning
+
+    @property
+    def time(self) -> float:
+        """Time since the beginning of the simulation (s)."""
+        return self._step * self.sampling_time
+
+    @property
+    def x(self) -> np.ndarray:
+        """State of the patient model used by the controller, as a flat array of the 4 compartments."""
+        return self._x
+
+    @x.setter
+    def x(self, value: np.ndarray):
+        self._x = np.array(value, dtype=float).reshape(4)
+
+    @property
+    def tpeak_0(self) -> float:
+        """Peak time used to compute the last infusion rate (s)."""
+        return self._peak_step_0 * self.sampling_time
+
+    @property
+    def tpeak_1(self) -> float:
+        """Peak time obtained with the last infusion rate (s)."""
+        return self._peak_step_1 * self.sampling_time
+
+    def _peak_step(self, Ce_0: np.ndarray, infusion_rate: float) -> int:
+        """Return the step of the concentration peak when the infusion rate is applied from the current state.
+
+        Parameters
+        ----------
+        Ce_0 : np.ndarray
+            Concentration trajectory without infusion.
+        infusion_rate : float
+            Infusion rate applied during the control time.
+
+        Returns
+        -------
+        int
+            Number of sampling steps before the peak.
+        """
+        # Ce_0 + infusion_rate*Ce computed in a reused buffer
+        trajectory = np.multiply(self.Ce, infusion_rate, out=self._Ce_scratch)
+        trajectory += Ce_0
+        return int(trajectory.argmax())
 
     def one_step(self, target: float = 0) -> float:
         """Implement one_step of the model. It must be called each sampling time.
@@ -140,58 +199,56 @@ class TCIController():
 
         """
 
-        if self.time % self.control_time == 0 or target != self.target:
+        if self._step % self._n_control == 0 or target != self.target:
 
             # if the target change, we reset the peak time
             if target != self.target:
-                self.tpeak_0 = self.t_peak
+                self._peak_step_0 = self._n_peak
                 self.target = target
 
             # compute trajectory from where we are without any infusion
-            x_temp = self.x
-            Ce_0 = np.zeros(int(self.t_peak/self.sampling_time))
-            for t in range(int(self.t_peak/self.sampling_time)):
-                x_temp = self.Ad @ x_temp
-                Ce_0[t] = x_temp[self.target_id, 0]
+            Ce_0 = np.matmul(self._pow_row, self._x, out=self._Ce_0)
 
             # compute the infusion rate to reach the target
 
             # if we are close to the target, we compute the infusion rate to reach the target at the next step time
             if Ce_0[0] > 0.95*target and Ce_0[0] < 1.05 * target:
-                self.infusion_rate = (target - (self.Ad_control @ self.x)[0]) / self.Bd_control[0]
+                self.infusion_rate = float(target - (self.Ad_control @ self._x)[0]) / self._Bd_control_0
                 self.infusion_rate = max(0, self.infusion_rate)
             # if we are far from the target, we compute the infusion rate to reach the target at the next peak
             else:
                 # if the target is reached, we stop the infusion
-                if Ce_0[int(self.control_time/self.sampling_time)] > self.target:
+                if Ce_0[self._n_control] > self.target:
                     self.infusion_rate = 0
                 # if the target is not reached, we compute the infusion rate to reach the target at the next peak
                 else:
                     # compute a first guess of the infusion using the last peak time
-                    infusion_rate_temp = ((self.target - Ce_0[int(self.tpeak_0/self.sampling_time)-1]) /
-                                          self.Ce[int(self.tpeak_0/self.sampling_time)-1])
+                    index = self._peak_step_0 - 1
+                    infusion_rate_temp = (self.target - Ce_0[index]) / self.Ce[index]
                     self.infusion_rate = min(infusion_rate_temp, self.infusion_max)
-                    self.tpeak_1 = (Ce_0 + infusion_rate_temp*self.Ce).argmax() * self.sampling_time
+                    self._peak_step_1 = self._peak_step(Ce_0, infusion_rate_temp)
                     counter = 0
+                    previous_step = None
                     # we iterate to find the peak time
-                    while self.tpeak_1 != self.tpeak_0 and counter < 500:
-                        self.tpeak_0 = self.tpeak_1
-                        infusion_rate_temp = ((self.target - Ce_0[int(self.tpeak_0/self.sampling_time)-1]) /
-                                              self.Ce[int(self.tpeak_0/self.sampling_time)-1])
+                    while self._peak_step_1 != self._peak_step_0 and counter < 500:
+                        # if the peak time oscillates between two values, the remaining iterations
+                        # would end on the current state when their number is even
+                        if self._peak_step_1 == previous_step and (500 - counter) % 2 == 0:
+                            counter = 500
+                            break
+                        previous_step = self._peak_step_0
+                        self._peak_step_0 = self._peak_step_1
+                        index = self._peak_step_0 - 1
+                        infusion_rate_temp = (self.target - Ce_0[index]) / self.Ce[index]
                         self.infusion_rate = max(min(infusion_rate_temp, self.infusion_max), 0)
-                        self.tpeak_1 = (Ce_0 + infusion_rate_temp*self.Ce).argmax() * self.sampling_time
+                        self._peak_step_1 = self._peak_step(Ce_0, infusion_rate_temp)
                         counter += 1
 
                     # if the peak time is not found, we use the last infusion rate
                     if counter == 500:
                         self.infusion_rate = max(min(infusion_rate_temp, self.infusion_max), 0)
 
-        else:
-            self.infusion_rate = self.infusion_rate
-
-        self.time += self.sampling_time
-        self.x = self.Ad @ self.x + self.Bd * self.infusion_rate
+        self._step += 1
+        self._x = self.Ad @ self._x + self._Bd * self.infusion_rate
         self.infusion_rate = max(min(self.infusion_rate, self.infusion_max), 0)
-        if isinstance(self.infusion_rate, np.ndarray):
-            self.infusion_rate = self.infusion_rate[0]
-        return float(self.infusion_rate / self.drug_concentration * 3600)
+        return float(self.infusion_rate * self._rate_to_ml_per_hr)
@@ -1,4 +1,5 @@
-from python_anesthesia_simulator.pd_models import BIS_model
+import numpy as np
+from python_anesthesia_simulator.pd_models import BIS_model, BIS_population
 
 # BIS_model object to test the Bouillon propofol-remifentanil interaction model
 bouillon_bis_model = BIS_model('Bouillon')
@@ -80,4 +81,60 @@ def test_inverse_hill():
     assert abs(eleveld_bis_model.inverse_hill
                (eleveld_bis_model.compute_bis(4)) - 4) < 1e-3
     assert abs(bouillon_bis_model.inverse_hill
-               (bouillon_bis_model.compute_bis(3,6),6) - 3) < 1e-3
\ No newline at end of file
+               (bouillon_bis_model.compute_bis(3,6),6) - 3) < 1e-3
+
+
+def test_eleveld_array_input():
+    """Check that the Eleveld model gives the same results on arrays and scalars without changing its slope"""
+    gamma = eleveld_bis_model.gamma
+    cep = np.linspace(0, 16, 33)
+    bis = eleveld_bis_model.compute_bis(cep)
+    assert np.allclose(bis, [eleveld_bis_model.compute_bis(c) for c in cep])
+    assert np.allclose([eleveld_bis_model.inverse_hill(b) for b in bis], cep, atol=1e-3)
+    assert eleveld_bis_model.gamma == gamma
+
+
+def test_inverse_hill_array_input():
+    """Check that inverse_hill broadcasts over BIS and Remifentanil arrays"""
+    cep = np.linspace(0.5, 12, 24)
+    cer = np.linspace(0, 8, 24)
+    bis = bouillon_bis_model.compute_bis(cep, cer)
+    assert np.allclose(bouillon_bis_model.inverse_hill(bis, cer), cep, atol=1e-3)
+    assert np.allclose(bouillon_bis_model.inverse_hill(bis, cer),
+                       [bouillon_bis_model.inverse_hill(b, r) for b, r in zip(bis, cer)])
+    bis = vanluchene_bis_model.compute_bis(cep)
+    assert np.allclose(vanluchene_bis_model.inverse_hill(bis), cep, atol=1e-3)
+
+
+def test_inverse_hill_remifentanil_only():
+    """Check that no Propofol is returned when Remifentanil alone reaches the BIS target"""
+    bis = bouillon_bis_model.compute_bis(0, 20)
+    assert bouillon_bis_model.inverse_hill(bis + 1, 20) == 0
+
+
+def test_bis_population():
+    """Check that the population model match N BIS_model drawn with the same seed"""
+    N = 20
+    for hill_model in ['Bouillon', 'Vanluchene', 'Eleveld']:
+        np.random.seed(1)
+        models = [BIS_model(hill_model=hill_model, random=True, age=50) for _ in range(N)]
+        np.random.seed(1)
+        population = BIS_population(N, hill_model=hill_model, random=True, age=50)
+        assert np.allclose(population.hill_param, np.array([model.hill_param for model in models]).T)
+
+        cep = np.linspace(0, 8, N)
+        cer = np.linspace(0, 6, N)
+        bis = population.compute_bis(cep, cer)
+        assert bis.shape == (N,)
+        assert np.allclose(bis, [model.compute_bis(p, r) for model, p, r in zip(models, cep, cer)])
+        assert np.allclose(population.inverse_hill(bis, cer)[1:], cep[1:], atol=1e-3)
+
+
+def test_blood_loss_array():
+    """Check that the blood loss update accepts an array of volume ratios"""
+    population = BIS_population(3, random=True)
+    population.update_param_blood_loss(np.array([1, 0.8, 0.6]))
+    assert np.allclose(population.c50p, population.c50p_init - 6*np.array([0, 0.2, 0.4]))
+    bis_model = BIS_model()
+    bis_model.update_param_blood_loss(np.array([1, 0.8]))
+    assert np.allclose(bis_model.c50p, [4.47, 4.47 - 1.2])
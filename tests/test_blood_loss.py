@@ -1,3 +1,4 @@
+import numpy as np
 import matplotlib.pyplot as plt
 from python_anesthesia_simulator import Patient, TCIController
 
@@ -36,19 +37,16 @@ time_start_bleeding = 61 * 60  # seconds
 time_end_bleeding = 71 * 60  # seconds
 time_start_transfusion = 75 * 60  #
 time_end_transfusion = 115 * 60  # seconds
+time_grid = np.arange(N_simu)*ts
+blood_rate = np.select([(time_grid > time_start_bleeding) & (time_grid < time_end_bleeding),
+                        (time_grid > time_start_transfusion) & (time_grid < time_end_transfusion)],
+                       [- blood_loss_rate, blood_gain_rate], default=0)
 for index in range(N_simu):
     uP = tci_propo.one_step(target_propo)/3600 * 10  # convert to mg/s
     uR = tci_remi.one_step(target_remi)/3600 * 10  # convert to mg/s
 
-    if index*ts > time_start_bleeding and index*ts < time_end_bleeding:
-        Bis, Co, Map, Tol = George.one_step(u_propo=uP, u_remi=uR, u_nore=uN,
-                                            blood_rate=- blood_loss_rate, noise=False)
-    elif index*ts > time_start_transfusion and index*ts < time_end_transfusion:
-        Bis, Co, Map, Tol = George.one_step(u_propo=uP, u_remi=uR, u_nore=uN,
-                                            blood_rate=blood_gain_rate, noise=False)
-    else:
-        Bis, Co, Map, Tol = George.one_step(u_propo=uP, u_remi=uR, u_nore=uN,
-                                            blood_rate=0, noise=False)
+    Bis, Co, Map, Tol = George.one_step(u_propo=uP, u_remi=uR, u_nore=uN,
+                                        blood_rate=blood_rate[index], noise=False)
 
 
 # %% test
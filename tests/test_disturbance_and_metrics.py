@@ -46,14 +46,16 @@ x = np.zeros((11, N_simu+1))
 # George_1.save_data([0, 0, 0])
 # George_2.save_data([0, 0, 0])
 # George_3.save_data([0, 0, 0])
+time_grid = np.arange(N_simu)*ts
+Dist_1 = disturbances.compute_disturbances_array(time_grid, dist_profil='realistic')
+Dist_2 = disturbances.compute_disturbances_array(time_grid, dist_profil='simple')
+Dist_3 = disturbances.compute_disturbances_array(time_grid, dist_profil='step',
+                                                 start_step=start_step, end_step=end_step)
 for index in range(N_simu):
-    Dist_1 = disturbances.compute_disturbances(index*ts, dist_profil='realistic')
-    George_1.one_step(uP, uR, dist=Dist_1, noise=False)
+    George_1.one_step(uP, uR, dist=Dist_1[index], noise=False)
     x[:, index+1] = A_nom @ x[:, index] + B_nom @ np.array([uP, uR])
-    Dist_2 = disturbances.compute_disturbances(index*ts, dist_profil='simple')
-    George_2.one_step(uP, uR, dist=Dist_2, noise=False)
-    Dist_3 = disturbances.compute_disturbances(index*ts, dist_profil='step', start_step=start_step, end_step=end_step)
-    George_3.one_step(uP, uR, dist=Dist_3, noise=False)
+    George_2.one_step(uP, uR, dist=Dist_2[index], noise=False)
+    George_3.one_step(uP, uR, dist=Dist_3[index], noise=False)
 
 # %% plots
 
@@ -132,6 +134,15 @@ metric_3 = metrics.compute_control_metrics(
     end_step=end_step
 )
 
+metric_3_ts = metrics.compute_control_metrics(
+    George_3.dataframe['Time'],
+    George_3.dataframe['BIS'],
+    phase='total',
+    start_step=start_step,
+    end_step=end_step,
+    ts=ts
+)
+
 metric_1_new = metrics.new_metrics_induction(
     George_1.dataframe.loc[:10*60/ts, 'Time'].values,
     George_1.dataframe.loc[:10*60/ts, 'BIS'].values,
@@ -159,6 +170,14 @@ def test_dynamic_simulation():
     assert np.allclose(George_1.dataframe['x_remi_5'], x[10, :])
 
 
+def test_disturbances_array():
+    for profil, dist in zip(['realistic', 'simple', 'step'], [Dist_1, Dist_2, Dist_3]):
+        dist_loop = [disturbances.compute_disturbances(t, dist_profil=profil, start_step=start_step, end_step=end_step)
+                     for t in time_grid]
+        assert np.allclose(dist, dist_loop)
+    assert np.allclose(disturbances.compute_disturbances_array(time_grid, dist_profil='null'), 0)
+
+
 def test_metrics():
     # No undershoot during induction
     assert metric_1['BIS_NADIR'].iloc[0] > 50
@@ -188,6 +207,9 @@ def test_metrics():
     assert np.isnan(metric_3['TTn'].iloc[0])
     assert metric_3['BIS_NADIRn'].iloc[0] < 50
 
+    # uniform grid shortcut gives the same metrics
+    assert metric_3.equals(metric_3_ts)
+
 
 def test_new_metrics():
     """test the new metrics."""
@@ -73,6 +73,21 @@ def test_hill_inversion():
     assert abs(ce_propo - ce_propo_computed) < 1e-3
 
 
+def test_equilibrium_independent_of_previous_calls():
+    """ensure that find_equilibrium gives the same result for a fresh patient and after other targets"""
+    targets = [(50, 0.9, 80), (40, 0.95, 70), (70, 0.5, 90), (30, 0.99, 65)]
+    np.random.seed(1)
+    patient_fresh = Patient([50, 170, 70, 1], ts=2, random_PK=True, random_PD=True)
+    np.random.seed(1)
+    patient_used = Patient([50, 170, 70, 1], ts=2, random_PK=True, random_PD=True)
+    for target in targets:
+        patient_used.find_equilibrium(*target)
+
+    u_fresh = patient_fresh.find_equilibrium(60, 0.2, 85)
+    u_used = patient_used.find_equilibrium(60, 0.2, 85)
+    assert np.allclose(u_fresh, u_used, rtol=1e-9)
+
+
 # %% plot
 if __name__ == '__main__':
     fig, ax = plt.subplots(3)
@@ -0,0 +1,56 @@
+import numpy as np
+from python_anesthesia_simulator.pd_models import Hemo_meca_PD_model, Hemo_meca_PD_ensemble
+
+# %% Initialization of the patients
+ts = 5
+age = 50
+n_patients = 10
+
+np.random.seed(0)
+patients = [Hemo_meca_PD_model(age, ts, random=True) for _ in range(n_patients)]
+np.random.seed(0)
+ensemble = Hemo_meca_PD_ensemble(n_patients, age, ts, random=True)
+
+# %% run a simple simulation with norepinephrine
+N_simu = int(20 * 60/ts)
+cp_propo = np.full(N_simu, 3.)
+cp_remi = np.full(N_simu, 4.)
+cp_nore = np.zeros(N_simu)
+cp_nore[N_simu//2:] = 1
+
+y_patients = np.stack([patient.full_sim(cp_propo, cp_remi, cp_nore) for patient in patients], axis=2)
+y_ensemble = ensemble.full_sim(cp_propo, cp_remi, cp_nore)
+
+
+# %% Test function
+
+def test_ensemble_match_patients():
+    """Ensure that the ensemble gives the same output as the patients simulated one by one."""
+    assert y_ensemble.shape == (N_simu, 5, n_patients)
+    assert np.allclose(y_ensemble, y_patients, rtol=1e-12)
+
+
+def test_ensemble_input_per_patient():
+    """Ensure that each patient of the ensemble can receive its own concentration."""
+    ensemble = Hemo_meca_PD_ensemble(2, age, ts, random=False)
+    patient = Hemo_meca_PD_model(age, ts)
+    for _ in range(50):
+        y_ensemble = ensemble.one_step(np.array([0, 3]), 4)
+        y_patient = patient.one_step(3, 4)
+    assert np.allclose(y_ensemble[:, 1], y_patient, rtol=1e-12)
+    assert not np.allclose(y_ensemble[:, 0], y_patient)
+
+
+def test_ensemble_equilibrium():
+    """Ensure that the equilibrium of the ensemble is the one of each patient."""
+    # start from freshly built models, the newton solver can fail from the state reached after full_sim
+    np.random.seed(0)
+    patients = [Hemo_meca_PD_model(age, ts, random=True) for _ in range(n_patients)]
+    np.random.seed(0)
+    ensemble = Hemo_meca_PD_ensemble(n_patients, age, ts, random=True)
+    output_patients = np.stack([patient.state_at_equilibrium(2, 2, 0.5) for patient in patients], axis=1)
+    output_ensemble = ensemble.state_at_equilibrium(2, 2, 0.5)
+    assert output_ensemble.shape == (5, n_patients)
+    assert np.isfinite(output_ensemble).all()
+    assert np.allclose(output_ensemble, output_patients, rtol=1e-6)
+    assert np.allclose(ensemble.x_eq, np.stack([patient.x_eq for patient in patients], axis=1), rtol=1e-6)
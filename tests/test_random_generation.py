@@ -55,3 +55,14 @@ def test_acceptable_random_output():
     assert np.all(george_random.dataframe['MAP'] >= 0)
     assert np.all(george_random.dataframe['CO'] <= 20)
     assert np.all(george_random.dataframe['CO'] >= 0)
+
+
+def test_one_step_after_full_sim():
+    """Ensure that the inputs of one_step are saved when it follows a full_sim."""
+    george = simulator.Patient([age, height, weight, gender], ts=ts)
+    george.full_sim(np.full(10, uP), np.full(10, uR), np.full(10, uN))
+    george.one_step(3, 4, 0)
+    assert len(george.dataframe) == 2
+    assert george.dataframe['u_propo'].iloc[0] == 3
+    assert george.dataframe['u_remi'].iloc[0] == 4
+    assert george.dataframe['Time'].iloc[-1] == ts